@@ -0,0 +1,18 @@
+"""Project-relative paths shared by the dashboard and the command-line scripts.
+
+Kept in a tiny module of plain constants so the compiled `.pyc` can be reused
+by every script launch instead of recomputing the paths each time.
+"""
+
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT, "data", "students")
+MODELS_DIR = os.path.join(ROOT, "models")
+REPORTS_DIR = os.path.join(ROOT, "excel_reports")
+CENTROIDS = os.path.join(MODELS_DIR, "centroids.json")  # legacy JSON layout, read only
+CENTROIDS_NPY = os.path.join(MODELS_DIR, "centroids.npy")  # (N, D) float16 matrix
+CENTROID_LABELS = os.path.join(MODELS_DIR, "centroid_labels.json")  # row labels for the matrix
+EMB_FILE = os.path.join(MODELS_DIR, "embeddings.npz")
+CLASSES_META = os.path.join(MODELS_DIR, "classes_meta.json")
+STUDENTS_META = os.path.join(MODELS_DIR, "students_meta.json")
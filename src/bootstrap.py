@@ -2,11 +2,15 @@
 
 When run, this script ensures necessary directories and minimal files exist:
 - `data/students/`
-- `models/` and files: `centroids.json`, `classes_meta.json`, `students_meta.json`
+- `models/` and files: `classes_meta.json`, `students_meta.json` (centroids are
+  written by `train_centroid.py` / the dashboard as `centroids.npy` + `centroid_labels.json`)
 - `excel_reports/`
 
+After a successful run it writes `models/.bootstrap_ok`; later runs skip the
+folder/file checks while that marker exists (delete it to force them again).
+
 It also inspects current model artifacts and prints a recommendation:
-- If `models/centroids.json` exists and has centroids -> recommend running `verify_realtime.py` (start attendance)
+- If `models/centroids.npy` (or the legacy `models/centroids.json`) has centroids -> recommend running `verify_realtime.py` (start attendance)
 - Else if `models/embeddings.npz` exists -> recommend running `train_centroid.py` first
 - Else recommend running `verify_realtime.py` to collect frames, then build embeddings and run `train_centroid.py`.
 
@@ -15,104 +19,194 @@ Run: python3 src/bootstrap.py
 
 import os
 import sys
-import json
-import platform
-from pathlib import Path
-from datetime import datetime
-
-ROOT = os.path.normpath(os.path.join(os.path.dirname(__file__), ".."))
-DATA_DIR = os.path.join(ROOT, "data", "students")
-MODELS_DIR = os.path.join(ROOT, "models")
-REPORTS_DIR = os.path.join(ROOT, "excel_reports")
-CENTROIDS = os.path.join(MODELS_DIR, "centroids.json")
-EMB_FILE = os.path.join(MODELS_DIR, "embeddings.npz")
-CLASSES_META = os.path.join(MODELS_DIR, "classes_meta.json")
-STUDENTS_META = os.path.join(MODELS_DIR, "students_meta.json")
+
+from _paths import (
+    ROOT,
+    DATA_DIR,
+    MODELS_DIR,
+    REPORTS_DIR,
+    CENTROIDS,
+    CENTROIDS_NPY,
+    CENTROID_LABELS,
+    EMB_FILE,
+    CLASSES_META,
+    STUDENTS_META,
+)
+
+CENTROIDS_META = os.path.join(MODELS_DIR, "centroids.meta")  # cached emptiness check
+BOOTSTRAP_OK = os.path.join(MODELS_DIR, ".bootstrap_ok")  # delete to force a full re-check
+BOOTSTRAP_VERSION = "v1"
 
 DEFAULT_CLASSES_META = {"next_id": 1, "classes": {}}
 DEFAULT_STUDENTS_META = {"next_id": 1, "students": {}}
 
+# recommendation text, built once: the python command only depends on the OS
+_PY = "python" if sys.platform.startswith("win") else "python3"  # macOS, Linux: python3
+_MSG_HEADER = "\n" + "="*70 + "\nSETUP COMPLETE!\n" + "="*70 + "\n"
+_MSG_READY = _MSG_HEADER + f"""
+✓ Face recognition model is ready (centroids found).
+
+Next step: Start the web dashboard OR camera mode:
+
+  Web Dashboard:
+    {_PY} src/index.py
+    Then open: http://127.0.0.1:50135
+
+  OR Camera Mode:
+    {_PY} src/verify_realtime.py
+"""
+# centroids missing or empty
+_MSG_NEED_CENTROIDS = _MSG_HEADER + f"""
+⚠ Face embeddings found, but centroids not yet built.
+
+Next step: Build centroids:
+  {_PY} src/train_centroid.py
+
+Then: Start web dashboard or camera mode (see instructions above).
+"""
+# neither centroids nor embeddings exist
+_MSG_NEED_ALL = _MSG_HEADER + f"""
+⚠ No face recognition model found (no embeddings or centroids).
+
+Next steps:
+  1. Collect face images: {_PY} src/verify_realtime.py
+     (This captures faces and creates embeddings)
+  2. Build centroids:     {_PY} src/train_centroid.py
+  3. Start dashboard:     {_PY} src/index.py
+
+For web dashboard without face recognition:
+  {_PY} src/index.py
+  (You can manually register students and mark attendance)
+"""
+
 
 def ensure_dir(p: str):
-    Path(p).mkdir(parents=True, exist_ok=True)
+    # a stat is cheaper than a mkdir that fails with EEXIST
+    if not os.path.isdir(p):
+        os.makedirs(p, exist_ok=True)
+
+
+def _dumps(data, pretty: bool = False) -> str:
+    import json
+    if pretty:
+        return json.dumps(data, indent=2)
+    return json.dumps(data, separators=(",", ":"))
 
 
-def write_json(path: str, data):
-    with open(path, "w") as f:
-        json.dump(data, f, indent=2, default=str)
+def write_json(path: str, data, pretty: bool = False):
+    """Write `data` as compact JSON; `pretty=True` indents it for humans.
 
+    `data` must contain only JSON-native types.
+    """
+    blob = _dumps(data, pretty)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(blob)
 
-def ensure_file(path: str, default_data):
-    if not os.path.exists(path):
-        write_json(path, default_data)
-        print(f"✓ Created: {path}")
+
+def ensure_file(path: str, default_data, existing=None, pretty: bool = False):
+    """Create `path` with `default_data` unless it already exists.
+
+    `existing` is an optional set of file names already present in the parent
+    directory, so several files can be checked against one listing.
+    Returns the status line for the caller to print.
+    """
+    if existing is None:
+        present = os.path.exists(path)
     else:
-        print(f"✓ OK: {path} (exists)")
+        present = os.path.basename(path) in existing
+    if not present:
+        write_json(path, default_data, pretty=pretty)
+        return f"✓ Created: {path}"
+    return f"✓ OK: {path} (exists)"
+
+
+def _centroids_nonempty() -> bool:
+    """Check whether centroids.json holds at least one centroid.
+
+    Only the head of the file is read: the first character after
+    `"centroids": {` tells us whether the dict is empty. Falls back to a full
+    parse when the file does not start with the expected layout.
+    """
+    import re
+
+    with open(CENTROIDS, "rb") as f:
+        blob = f.read(4096)
+    m = re.search(rb'"centroids"\s*:\s*\{\s*(.)', blob)
+    if m:
+        return m.group(1) != b"}"
+    try:
+        import orjson  # optional, much faster on large files
+        with open(CENTROIDS, "rb") as f:
+            data = orjson.loads(f.read())
+    except ImportError:
+        import json
+        with open(CENTROIDS, "r") as f:
+            data = json.load(f)
+    cents = data.get("centroids", {})
+    return isinstance(cents, dict) and len(cents) > 0
 
 
 def inspect_and_recommend():
     """Decide which script should be run next and explain steps."""
+    import json
+
     centroids_ok = False
-    if os.path.exists(CENTROIDS):
+    if os.path.exists(CENTROIDS_NPY) and os.path.exists(CENTROID_LABELS):
+        # matrix layout: the labels file alone tells whether any rows exist
         try:
-            with open(CENTROIDS, "r") as f:
-                data = json.load(f)
-            cents = data.get("centroids", {})
-            if isinstance(cents, dict) and len(cents) > 0:
-                centroids_ok = True
+            with open(CENTROID_LABELS, "r") as f:
+                centroids_ok = len(json.load(f)) > 0
+        except Exception:
+            centroids_ok = False
+    elif os.path.exists(CENTROIDS):
+        try:
+            st = os.stat(CENTROIDS)
+            # reuse the cached result while centroids.json is unchanged
+            cached = None
+            if os.path.exists(CENTROIDS_META):
+                with open(CENTROIDS_META, "r") as f:
+                    cached = json.load(f)
+            if cached and cached.get("mtime") == st.st_mtime and "has_centroids" in cached:
+                centroids_ok = bool(cached["has_centroids"])
+            else:
+                centroids_ok = _centroids_nonempty()
+                write_json(CENTROIDS_META, {"has_centroids": centroids_ok, "mtime": st.st_mtime})
         except Exception:
             centroids_ok = False
 
-    system = platform.system()
-    if system == "Windows":
-        py_cmd = "python"
-    else:  # macOS, Linux
-        py_cmd = "python3"
-
-    print("\n" + "="*70)
-    print("SETUP COMPLETE!")
-    print("="*70)
-
+    # messages are prebuilt at import; emit the chosen one with a single write
     if centroids_ok:
-        print("\n✓ Face recognition model is ready (centroids found).")
-        print("\nNext step: Start the web dashboard OR camera mode:")
-        print(f"\n  Web Dashboard:\n    {py_cmd} src/index.py")
-        print("    Then open: http://127.0.0.1:50135")
-        print(f"\n  OR Camera Mode:\n    {py_cmd} src/verify_realtime.py")
-        return
-
-    # centroids missing or empty
-    if os.path.exists(EMB_FILE):
-        print("\n⚠ Face embeddings found, but centroids not yet built.")
-        print(f"\nNext step: Build centroids:\n  {py_cmd} src/train_centroid.py")
-        print("\nThen: Start web dashboard or camera mode (see instructions above).")
-        return
-
-    # neither centroids nor embeddings exist
-    print("\n⚠ No face recognition model found (no embeddings or centroids).")
-    print("\nNext steps:")
-    print(f"  1. Collect face images: {py_cmd} src/verify_realtime.py")
-    print("     (This captures faces and creates embeddings)")
-    print(f"  2. Build centroids:     {py_cmd} src/train_centroid.py")
-    print(f"  3. Start dashboard:     {py_cmd} src/index.py")
-    print("\nFor web dashboard without face recognition:")
-    print(f"  {py_cmd} src/index.py")
-    print("  (You can manually register students and mark attendance)")
+        sys.stdout.write(_MSG_READY)
+    elif os.path.exists(EMB_FILE):
+        sys.stdout.write(_MSG_NEED_CENTROIDS)
+    else:
+        sys.stdout.write(_MSG_NEED_ALL)
 
 
 if __name__ == '__main__':
-    print("Bootstrap started:")
-    print(f"Root: {ROOT}")
-
-    ensure_dir(DATA_DIR)
-    ensure_dir(MODELS_DIR)
-    ensure_dir(REPORTS_DIR)
-
-    # ensure minimal model files
-    ensure_file(CENTROIDS, {"centroids": {}})
-    ensure_file(CLASSES_META, DEFAULT_CLASSES_META)
-    ensure_file(STUDENTS_META, DEFAULT_STUDENTS_META)
-
-    # touch embeddings.npz only if user wants; do not create binary placeholder
-    print("\nDone creating minimal files/folders.")
+    lines = [
+        "Bootstrap started:",
+        f"Root: {ROOT}",
+    ]
+
+    if os.path.exists(BOOTSTRAP_OK):
+        # a previous run already created everything below
+        lines.append("Bootstrap cached, skipping folder/file checks.")
+    else:
+        for p in (DATA_DIR, MODELS_DIR, REPORTS_DIR):
+            ensure_dir(p)
+
+        # ensure minimal meta files, checked against one directory listing
+        existing = {e.name for e in os.scandir(MODELS_DIR)}
+        for p, d, pretty in (
+            (CLASSES_META, DEFAULT_CLASSES_META, True),
+            (STUDENTS_META, DEFAULT_STUDENTS_META, True),
+        ):
+            lines.append(ensure_file(p, d, existing, pretty=pretty))
+
+        # touch embeddings.npz only if user wants; do not create binary placeholder
+        lines.append("\nDone creating minimal files/folders.")
+        with open(BOOTSTRAP_OK, "w") as f:
+            f.write(BOOTSTRAP_VERSION)
+    sys.stdout.write("\n".join(lines) + "\n")
     inspect_and_recommend()
@@ -2,10 +2,18 @@
 import os
 import re
 import json
+import pickle
 import time
+import threading
+import queue
+import atexit
 import base64
-from datetime import datetime
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
+from xml.sax.saxutils import escape as xml_escape
 from typing import Dict
 import numpy as np
 import cv2
@@ -18,52 +26,129 @@ except Exception:
   HAS_INSIGHTFACE = False
   print("Warning: insightface not available; face recognition features are disabled.")
 try:
-  from openpyxl import Workbook, load_workbook
+  import pybase64  # optional: SIMD base64 decoder, several times faster on camera frames
+  b64decode = pybase64.b64decode
+except Exception:
+  b64decode = base64.b64decode
+try:
+  from turbojpeg import TurboJPEG, TJPF_BGR  # optional: libjpeg-turbo decoder, faster than cv2.imdecode
+  _turbojpeg = TurboJPEG()  # raises if the shared library is missing
+  HAS_TURBOJPEG = True
+except Exception:
+  _turbojpeg = None
+  HAS_TURBOJPEG = False
+try:
+  import faiss  # optional: inner-product index over centroids when SimSIMD is missing
+  HAS_FAISS = True
+except Exception:
+  faiss = None
+  HAS_FAISS = False
+try:
+  import simsimd  # optional: SIMD dot products for centroid matching
+  HAS_SIMSIMD = True
+except Exception:
+  simsimd = None
+  HAS_SIMSIMD = False
+try:
+  from numba import njit, prange  # optional: compiled numeric kernels
+  HAS_NUMBA = True
+except Exception:
+  njit = prange = None
+  HAS_NUMBA = False
+try:
+  from openpyxl import load_workbook
+  from openpyxl.writer.excel import ExcelWriter
   from openpyxl.styles import Font, PatternFill, Alignment
   HAS_OPENPYXL = True
 except Exception:
-  Workbook = None
-  load_workbook = None
+  load_workbook = ExcelWriter = None
   Font = PatternFill = Alignment = None
   HAS_OPENPYXL = False
   print("Warning: openpyxl not installed; Excel report features are disabled.")
+try:
+  import xlsxwriter  # optional: much faster writer for the summary sheet
+  HAS_XLSXWRITER = True
+except Exception:
+  xlsxwriter = None
+  HAS_XLSXWRITER = False
 
 
-# basic paths and configuration (relative to project root for cross-platform compatibility)
-ROOT = os.path.normpath(os.path.join(os.path.dirname(__file__), ".."))
-DATA_DIR = os.path.join(ROOT, "data", "students")
-MODELS_DIR = os.path.join(ROOT, "models")
-CENTROIDS = os.path.join(MODELS_DIR, "centroids.json")
+# basic paths (relative to project root for cross-platform compatibility) and configuration
+try:
+  from _paths import (ROOT, DATA_DIR, MODELS_DIR, REPORTS_DIR, CENTROIDS, CENTROIDS_NPY,
+                      CENTROID_LABELS, CLASSES_META, STUDENTS_META)
+except ImportError:  # imported as src.index, as streamlit_app.py does
+  from src._paths import (ROOT, DATA_DIR, MODELS_DIR, REPORTS_DIR, CENTROIDS, CENTROIDS_NPY,
+                          CENTROID_LABELS, CLASSES_META, STUDENTS_META)
 
 THRESHOLD = float(os.getenv("THRESHOLD", "0.45"))
-DET_SIZE = (640, 640)
+# detector input size; it only locates faces (the aligned crop for recognition
+# is cut from the full decoded frame). 640 keeps small and far faces in
+# classroom shots; set DET_SIZE=320 for faster detection when every face is
+# close to the camera
+DET_SIZE = (int(os.getenv("DET_SIZE", "640")),) * 2
 COOLDOWN_S = 600  # minimum seconds between repeated logs for same face
+# larger frames are scaled down before detection (see fit_frame)
+MAX_FRAME_SIDE = int(os.getenv("MAX_FRAME_SIDE", "640"))
+# encoded frames above this size are decoded at half resolution straight away
+REDUCED_DECODE_BYTES = 500_000
+
+# OpenCV's worker pool would otherwise take every core and compete with
+# onnxruntime's threads during detection
+cv2.setNumThreads(max(1, (os.cpu_count() or 2) // 2))
+cv2.setUseOptimized(True)  # SIMD resize/convert paths
 
-Path(DATA_DIR).mkdir(parents=True, exist_ok=True)
-Path(MODELS_DIR).mkdir(parents=True, exist_ok=True)
+@lru_cache(maxsize=None)
+def _ensure_dir(path: str):
+  # directories are created on first write instead of at import; cached so
+  # later writes skip the syscall
+  os.makedirs(path, exist_ok=True)
 
 
-# Excel-based storage configuration
-REPORTS_DIR = os.path.join(ROOT, "excel_reports")
-CLASSES_META = os.path.join(MODELS_DIR, "classes_meta.json")
-STUDENTS_META = os.path.join(MODELS_DIR, "students_meta.json")
+# parsed meta JSON keyed by path -> ((mtime_ns, size), pickled data, hash of its serialized
+# form); reloaded when the file changes. Every load unpickles a private copy (cheaper than
+# re-parsing the JSON or a deepcopy), so callers and request threads may mutate what they
+# get without touching the cache; changes reach it, and the disk, only via save_json_file.
+_meta_cache: Dict[str, tuple] = {}
 
-Path(REPORTS_DIR).mkdir(parents=True, exist_ok=True)
-Path(MODELS_DIR).mkdir(parents=True, exist_ok=True)
+def _dump_meta(data) -> str:
+  return json.dumps(data, indent=2, default=str)
 
+def _file_stamp(path):
+  st = os.stat(path)
+  return (st.st_mtime_ns, st.st_size)
 
 def load_json_file(path, default):
-  if not os.path.exists(path):
+  try:
+    stamp = _file_stamp(path)
+  except OSError:
     return default
+  cached = _meta_cache.get(path)
+  if cached and cached[0] == stamp:
+    return pickle.loads(cached[1])
   with open(path, "r") as f:
     try:
-      return json.load(f)
+      data = json.load(f)
     except Exception:
       return default
+  _meta_cache[path] = (stamp, pickle.dumps(data, pickle.HIGHEST_PROTOCOL), hash(_dump_meta(data)))
+  return data
 
 def save_json_file(path, data):
+  blob = _dump_meta(data)
+  digest = hash(blob)
+  cached = _meta_cache.get(path)
+  if cached and cached[2] == digest:
+    try:
+      if _file_stamp(path) == cached[0]:
+        return  # same content as the file on disk
+    except OSError:
+      pass
+  _ensure_dir(os.path.dirname(path))
   with open(path, "w") as f:
-    json.dump(data, f, indent=2, default=str)
+    f.write(blob)
+  # keep the cache in sync so the next load does not re-read what we just wrote
+  _meta_cache[path] = (_file_stamp(path), pickle.dumps(data, pickle.HIGHEST_PROTOCOL), digest)
 
 def load_classes_meta():
   return load_json_file(CLASSES_META, {"next_id": 1, "classes": {}})
@@ -85,11 +170,11 @@ def _class_filepath_for_id(class_id: int) -> str | None:
   return cls.get("file")
 
 def ensure_reports_setup():
-  # ensure meta files exist
-  m = load_classes_meta()
-  save_classes_meta(m)
-  s = load_students_meta()
-  save_students_meta(s)
+  # ensure meta files exist; existing ones are left untouched
+  if not os.path.exists(CLASSES_META):
+    save_classes_meta(load_classes_meta())
+  if not os.path.exists(STUDENTS_META):
+    save_students_meta(load_students_meta())
 
 # student helpers (Excel-backed)
 def upsert_student(face_label: str, student_name: str, student_code: str) -> int:
@@ -114,6 +199,74 @@ def get_student_id_by_face_label(face_label: str) -> int | None:
   return None
 
 # professor and class helpers
+# Skeleton of a new class workbook (sheets meta, students, sessions). Only the
+# sheet XML depends on the class, so the package parts are built once here and
+# the file is zipped directly instead of going through openpyxl for a few rows.
+_CLASS_SHEETS = ("meta", "students", "sessions")
+_XLSX_STATIC_PARTS = {
+  "[Content_Types].xml": (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    + "".join(
+      f'<Override PartName="/xl/worksheets/sheet{i}.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+      for i in range(1, len(_CLASS_SHEETS) + 1)
+    )
+    + "</Types>"
+  ),
+  "_rels/.rels": (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    "</Relationships>"
+  ),
+  "xl/workbook.xml": (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+    + "".join(
+      f'<sheet name="{name}" sheetId="{i}" r:id="rId{i}"/>'
+      for i, name in enumerate(_CLASS_SHEETS, start=1)
+    )
+    + "</sheets></workbook>"
+  ),
+  "xl/_rels/workbook.xml.rels": (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    + "".join(
+      f'<Relationship Id="rId{i}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet{i}.xml"/>'
+      for i in range(1, len(_CLASS_SHEETS) + 1)
+    )
+    + "</Relationships>"
+  ),
+}
+
+def _xlsx_sheet_xml(rows) -> str:
+  # inline strings avoid a sharedStrings part; openpyxl and Excel both read them
+  out = ['<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+         '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>']
+  for r, row in enumerate(rows, start=1):
+    out.append(f'<row r="{r}">')
+    for col, value in enumerate(row):
+      ref = f"{chr(ord('A') + col)}{r}"
+      if isinstance(value, (int, float)) and not isinstance(value, bool):
+        out.append(f'<c r="{ref}"><v>{value}</v></c>')
+      else:
+        out.append(f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{xml_escape(str(value))}</t></is></c>')
+    out.append("</row>")
+  out.append("</sheetData></worksheet>")
+  return "".join(out)
+
+def _write_new_class_xlsx(filepath: str, sheets_rows: list):
+  """Write a class workbook whose sheets (in _CLASS_SHEETS order) hold `sheets_rows`."""
+  with zipfile.ZipFile(filepath, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+    for name, blob in _XLSX_STATIC_PARTS.items():
+      zf.writestr(name, blob)
+    for i, rows in enumerate(sheets_rows, start=1):
+      zf.writestr(f"xl/worksheets/sheet{i}.xml", _xlsx_sheet_xml(rows))
+
 def create_class(face_label: str, professor_name: str, professor_code: str, class_name: str) -> int:
   meta = load_classes_meta()
   cid = meta["next_id"]
@@ -122,10 +275,8 @@ def create_class(face_label: str, professor_name: str, professor_code: str, clas
   safe_name = re.sub(r"[^a-zA-Z0-9_-]", "_", class_name)
   filename = f"class_{cid}_{safe_name}.xlsx"
   filepath = os.path.join(REPORTS_DIR, filename)
+  _ensure_dir(REPORTS_DIR)
 
-  wb = Workbook()
-  ws_meta = wb.active
-  ws_meta.title = "meta"
   headers = [
     "class_id",
     "class_name",
@@ -144,16 +295,11 @@ def create_class(face_label: str, professor_name: str, professor_code: str, clas
     datetime.now().isoformat(),
     0,
   ]
-  ws_meta.append(headers)
-  ws_meta.append(values)
-
-  ws_students = wb.create_sheet("students")
-  ws_students.append(["student_id", "face_label", "student_name", "student_code", "total_present"])
-
-  ws_sessions = wb.create_sheet("sessions")
-  ws_sessions.append(["session_id", "timestamp", "student_id", "face_label", "student_name", "student_code"])
-
-  wb.save(filepath)
+  _write_new_class_xlsx(filepath, [
+    [headers, values],
+    [["student_id", "face_label", "student_name", "student_code", "total_present"]],
+    [["session_id", "timestamp", "student_id", "face_label", "student_name", "student_code"]],
+  ])
 
   meta.setdefault("classes", {})[str(cid)] = {
     "file": filepath,
@@ -164,88 +310,184 @@ def create_class(face_label: str, professor_name: str, professor_code: str, clas
     "start_time": datetime.now().isoformat(),
     "session_count": 0,
   }
+  _latest_by_prof(meta)[face_label] = cid
   save_classes_meta(meta)
   return cid
 
+def _latest_by_prof(meta) -> dict:
+  """professor face label -> id of their newest class, kept in classes_meta.json.
+
+  Older meta files lack the map; it is rebuilt once from the start times.
+  """
+  latest = meta.get("latest_by_prof")
+  if latest is None:
+    latest = {}
+    best_time = {}
+    for cid, info in meta.get("classes", {}).items():
+      prof = info.get("professor_label")
+      st = info.get("start_time")
+      if st is None:
+        continue
+      if prof not in latest or st > best_time[prof]:
+        latest[prof] = int(cid)
+        best_time[prof] = st
+    meta["latest_by_prof"] = latest
+  return latest
+
 def get_latest_class_for_professor(face_label: str):
   meta = load_classes_meta()
-  best = None
-  best_time = None
-  for cid, info in meta.get("classes", {}).items():
-    if info.get("professor_label") != face_label:
+  rebuilt = "latest_by_prof" not in meta
+  cid = _latest_by_prof(meta).get(face_label)
+  if rebuilt:
+    save_classes_meta(meta)  # keep the rebuilt map instead of redoing it per call
+  cls = meta.get("classes", {}).get(str(cid)) if cid is not None else None
+  if cls is None:
+    return None, None
+  return int(cid), cls.get("class_name")
+
+# per-class lookup tables built from the workbook so check-ins avoid rescanning it:
+# class_id -> {"stamp": file stamp, "students": {face_label: row}, "dates": {date: {student_id}}}
+_class_row_index: Dict[int, dict] = {}
+
+def _get_class_row_index(class_id: int, filepath: str) -> dict:
+  stamp = _file_stamp(filepath)
+  entry = _class_row_index.get(class_id)
+  if entry and entry["stamp"] == stamp:
+    return entry
+  with _wb_lock:
+    return _build_class_row_index(class_id, filepath, stamp)
+
+def _build_class_row_index(class_id: int, filepath: str, stamp) -> dict:
+  wb = _get_class_wb(class_id, filepath)
+  students = {}
+  for idx, row in enumerate(wb["students"].iter_rows(min_row=2, max_col=2, values_only=True), start=2):
+    if row[1] is not None:
+      students.setdefault(row[1], idx)
+  dates = {}
+  for r in wb["sessions"].iter_rows(min_row=2, max_col=3, values_only=True):
+    ts = r[1]
+    # we write isoformat strings, but a workbook edited in Excel may hold real datetimes
+    if isinstance(ts, datetime):
+      sess_date = ts.date()
+    elif isinstance(ts, str):
+      try:
+        sess_date = datetime.fromisoformat(ts).date()
+      except ValueError:
+        continue
+    else:
       continue
-    st = info.get("start_time")
-    if st is None:
+    dates.setdefault(sess_date, set()).add(r[2])
+  entry = {"stamp": stamp, "students": students, "dates": dates}
+  _class_row_index[class_id] = entry
+  return entry
+
+# open workbooks for classes in use, so a burst of check-ins does not re-parse
+# and re-serialise the whole file each time; dirty ones are saved by a timer,
+# before anything reads the file back, and at exit.
+# class_id -> {"wb", "path", "stamp": file stamp when loaded/saved, "dirty", "used"}
+_wb_cache: Dict[int, dict] = {}
+_wb_lock = threading.RLock()
+_wb_timer = None
+WB_FLUSH_S = 5.0  # max seconds a change stays only in memory
+WB_IDLE_S = 120.0  # drop cached workbooks unused for this long
+
+def _save_workbook(wb, filepath: str):
+  """wb.save(filepath) with fast deflate: zlib level 1 instead of the default 6.
+
+  Deflate dominates saving a cell-heavy workbook; level 1 is several times
+  faster for a slightly larger file.
+  """
+  wb.properties.modified = datetime.now(timezone.utc).replace(tzinfo=None)
+  # written beside the real file and swapped in, so readers never see a torn workbook
+  tmp = filepath + ".tmp"
+  archive = zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED, compresslevel=1, allowZip64=True)
+  ExcelWriter(wb, archive).save()  # closes the archive
+  os.replace(tmp, filepath)
+
+def _get_class_wb(class_id: int, filepath: str):
+  """Cached workbook for `class_id`; call with `_wb_lock` held."""
+  entry = _wb_cache.get(class_id)
+  if entry is not None and entry["path"] == filepath:
+    # reload a clean copy if something else rewrote the file
+    if entry["dirty"] or entry["stamp"] == _file_stamp(filepath):
+      entry["used"] = time.monotonic()
+      return entry["wb"]
+  wb = load_workbook(filepath)
+  _wb_cache[class_id] = {"wb": wb, "path": filepath, "stamp": _file_stamp(filepath),
+                         "dirty": False, "used": time.monotonic()}
+  return wb
+
+def _mark_class_wb_dirty(class_id: int):
+  global _wb_timer
+  with _wb_lock:
+    _wb_cache[class_id]["dirty"] = True
+    if _wb_timer is None:
+      _wb_timer = threading.Timer(WB_FLUSH_S, _wb_timer_fired)
+      _wb_timer.daemon = True
+      _wb_timer.start()
+
+def _wb_timer_fired():
+  global _wb_timer
+  with _wb_lock:
+    _wb_timer = None
+    _flush_locked()
+    now = time.monotonic()
+    for cid in [c for c, e in _wb_cache.items() if now - e["used"] > WB_IDLE_S]:
+      del _wb_cache[cid]
+
+def _flush_locked(class_id: int | None = None, evict: bool = False):
+  ids = list(_wb_cache) if class_id is None else [class_id]
+  for cid in ids:
+    entry = _wb_cache.get(cid)
+    if entry is None:
       continue
-    if best is None or st > best_time:
-      best = cid
-      best_time = st
-  if best is None:
-    return None, None
-  return int(best), meta["classes"][best].get("class_name")
-
-def mark_student_attendance(face_label: str, class_id: int):
-  # Load class metadata and filepath
-  meta = load_classes_meta()
-  cls = meta.get("classes", {}).get(str(class_id))
-  if not cls:
-    return "Class", "Unknown", "Unknown"
-  class_name = cls.get("class_name", "Class")
-  filepath = cls.get("file")
-  if not filepath or not os.path.exists(filepath):
-    return class_name, "Unknown", "Unknown"
+    if entry["dirty"]:
+      old_stamp = entry["stamp"]
+      _save_workbook(entry["wb"], entry["path"])
+      entry["stamp"] = _file_stamp(entry["path"])
+      entry["dirty"] = False
+      # the row index already reflects these rows; keep it valid for the new file
+      row_index = _class_row_index.get(cid)
+      if row_index and row_index["stamp"] == old_stamp:
+        row_index["stamp"] = entry["stamp"]
+    if evict:
+      del _wb_cache[cid]
+
+def flush_class_workbooks(class_id: int | None = None, evict: bool = False):
+  """Save cached workbooks with pending changes (all, or just `class_id`).
+
+  Queued check-ins are applied first. `evict=True` also drops the workbooks
+  from the cache; use it before writing the file through anything other than
+  the cache. Must not be called with `_wb_lock` held.
+  """
+  ATT_Q.join()
+  with _wb_lock:
+    _flush_locked(class_id, evict)
 
-  # ensure student exists globally
-  sid = get_student_id_by_face_label(face_label)
-  if sid is None:
-    sid = upsert_student(face_label, *parse_label(face_label))
+atexit.register(flush_class_workbooks)
 
-  # current session id
-  session_id = int(cls.get("session_count", 0))
+# check-ins are queued by request threads and written into the cached workbooks
+# by one writer thread, so a request never waits on a workbook save
+ATT_Q: "queue.Queue[tuple]" = queue.Queue(maxsize=10000)
+_att_lock = threading.Lock()  # guards the duplicate check in the row index
+_att_writer = None
 
-  wb = load_workbook(filepath)
+def _apply_checkin(class_id, filepath, sid, face_label, student_name, student_code, session_id, ts):
+  """Write one queued check-in into the cached workbook; call with `_wb_lock` held."""
+  wb = _get_class_wb(class_id, filepath)
   ws_students = wb["students"]
-  ws_sessions = wb["sessions"]
+  students = _get_class_row_index(class_id, filepath)["students"]
 
   # find or add student row
-  student_row_idx = None
-  for idx, row in enumerate(ws_students.iter_rows(min_row=2, values_only=False), start=2):
-    cell_face = row[1].value
-    if cell_face == face_label:
-      student_row_idx = idx
-      break
+  student_row_idx = students.get(face_label)
   if student_row_idx is None:
-    # add new student
-    name = parse_label(face_label)[1]
-    code = parse_label(face_label)[0]
-    ws_students.append([sid, face_label, name, code, 0])
+    ws_students.append([sid, face_label, student_name, student_code, 0])
     student_row_idx = ws_students.max_row
-
-  # Prevent duplicate check-ins on the same calendar date
-  today = datetime.now().date()
-  already_today = False
-  for r in ws_sessions.iter_rows(min_row=2, values_only=True):
-    sess_id = r[0]
-    ts = r[1]
-    stuid = r[2]
-    try:
-      sess_date = datetime.fromisoformat(str(ts)).date()
-    except Exception:
-      sess_date = None
-    if stuid == sid and sess_date == today:
-      already_today = True
-      break
-
-  if already_today:
-    # nothing to change
-    student_name = parse_label(face_label)[1]
-    student_code = parse_label(face_label)[0]
-    return class_name, student_name, student_code, False
+    students[face_label] = student_row_idx
 
   # append session attendance (require an open session)
   if session_id > 0:
-    now_ts = datetime.now().isoformat()
-    ws_sessions.append([session_id, now_ts, sid, face_label, parse_label(face_label)[1], parse_label(face_label)[0]])
+    wb["sessions"].append([session_id, ts, sid, face_label, student_name, student_code])
     # increment student's total_present
     total_cell = ws_students.cell(row=student_row_idx, column=5)
     try:
@@ -253,38 +495,154 @@ def mark_student_attendance(face_label: str, class_id: int):
     except Exception:
       total_cell.value = 1
 
-  wb.save(filepath)
-  student_name = parse_label(face_label)[1]
-  student_code = parse_label(face_label)[0]
+  _mark_class_wb_dirty(class_id)
+
+def _attendance_writer_loop():
+  while True:
+    batch = [ATT_Q.get()]
+    # take whatever else queued up meanwhile: one lock round per burst
+    while True:
+      try:
+        batch.append(ATT_Q.get_nowait())
+      except queue.Empty:
+        break
+    with _wb_lock:
+      for item in batch:
+        try:
+          _apply_checkin(*item)
+        except Exception as e:
+          print(f"Warning: could not record check-in for {item[3]}: {e}")
+    for _ in batch:
+      ATT_Q.task_done()
+
+def _start_attendance_writer():
+  global _att_writer
+  if _att_writer is None:
+    with _att_lock:
+      if _att_writer is None:
+        _att_writer = threading.Thread(target=_attendance_writer_loop, name="attendance-writer", daemon=True)
+        _att_writer.start()
+
+def add_student_to_class(class_id: int, filepath: str, student_id: int, face_label: str,
+                         student_name: str, student_code: str) -> bool:
+  """Append a students-sheet row for `face_label` unless the class already has one.
+
+  Checks the row index instead of scanning the sheet and edits the cached
+  workbook, which the flush timer saves; returns True if a row was added.
+  """
+  with _wb_lock:
+    wb = _get_class_wb(class_id, filepath)
+    ws_students = wb["students"]
+    # labels map one-to-one onto student ids, so the label lookup covers both
+    students = _get_class_row_index(class_id, filepath)["students"]
+    if face_label in students:
+      return False
+    ws_students.append([student_id, face_label, student_name, student_code, 0])
+    students[face_label] = ws_students.max_row
+    _mark_class_wb_dirty(class_id)
+    return True
+
+def add_session_row(class_id: int, filepath: str, session_id: int):
+  """Append the opening row of session `session_id` to the cached class workbook."""
+  with _wb_lock:
+    wb = _get_class_wb(class_id, filepath)
+    wb["sessions"].append([session_id, datetime.now().isoformat(), "", "", "", ""])
+    _mark_class_wb_dirty(class_id)
+
+def mark_student_attendance(face_label: str, class_id: int, dt: datetime | None = None):
+  # Load class metadata and filepath
+  meta = load_classes_meta()
+  cls = meta.get("classes", {}).get(str(class_id))
+  if not cls:
+    return "Class", "Unknown", "Unknown"
+  class_name = cls.get("class_name", "Class")
+  filepath = cls.get("file")
+  if not filepath or not os.path.exists(filepath):
+    return class_name, "Unknown", "Unknown"
+
+  # ensure student exists globally
+  student_code, student_name = parse_label(face_label)
+  sid = get_student_id_by_face_label(face_label)
+  if sid is None:
+    sid = upsert_student(face_label, student_code, student_name)
+
+  # current session id
+  session_id = int(cls.get("session_count", 0))
+
+  # the duplicate decision is made here against the in-memory index; the
+  # workbook rows are written by the attendance writer thread
+  dt = dt or datetime.now()
+  today = dt.date()
+  with _att_lock:
+    row_index = _get_class_row_index(class_id, filepath)
+    # Prevent duplicate check-ins on the same calendar date
+    if sid in row_index["dates"].get(today, ()):
+      # nothing to change
+      return class_name, student_name, student_code, False
+    if session_id > 0:
+      row_index["dates"].setdefault(today, set()).add(sid)
+
+  _start_attendance_writer()
+  ATT_Q.put((class_id, filepath, sid, face_label, student_name, student_code,
+             session_id, dt.isoformat()))
   return class_name, student_name, student_code, True
 
 def get_class_summary(class_id: int):
   filepath = _class_filepath_for_id(class_id)
   if not filepath or not os.path.exists(filepath):
     return 0, 0, 0, []
+  flush_class_workbooks(class_id)
 
   meta = load_classes_meta()
   cls = meta.get("classes", {}).get(str(class_id), {})
   session_id = cls.get("session_count", 0)
 
-  wb = load_workbook(filepath, data_only=True)
-  ws_students = wb["students"]
-  ws_sessions = wb["sessions"]
+  # read-only mode streams rows instead of building every cell object
+  wb = load_workbook(filepath, read_only=True, data_only=True)
+  try:
+    ws_students = wb["students"]
+    ws_sessions = wb["sessions"]
 
-  total_students = max(0, ws_students.max_row - 1)
+    total_students = sum(1 for _ in ws_students.iter_rows(min_row=2, max_col=1, values_only=True))
 
-  present_ids = set()
-  present_list = []
-  if session_id > 0:
-    for r in ws_sessions.iter_rows(min_row=2, values_only=True):
-      if r[0] == session_id:
-        present_ids.add(r[2])
-        present_list.append((r[4], r[5]))
+    present_ids = set()
+    present_list = []
+    if session_id > 0:
+      for r in ws_sessions.iter_rows(min_row=2, max_col=6, values_only=True):
+        if r[0] == session_id:
+          present_ids.add(r[2])
+          present_list.append((r[4], r[5]))
+  finally:
+    wb.close()
 
   total_present = len(present_ids)
   total_absent = max(0, total_students - total_present)
   return total_students, total_present, total_absent, present_list
 
+SUMMARY_HEADERS = ["name", "id", "date", "no_of_present", "no_of_absent", "total_class"]
+
+def summary_rows_for_class(class_id: int) -> list | None:
+  """Summary sheet rows, header first, computed from the cached class workbook.
+
+  Nothing is written and the file is not re-read while the cache is valid;
+  None when the class has no workbook.
+  """
+  filepath = _class_filepath_for_id(class_id)
+  if not filepath or not os.path.exists(filepath):
+    return None
+  meta = load_classes_meta()
+  cls = meta.get("classes", {}).get(str(class_id), {})
+  total_sessions = int(cls.get("session_count", 0))
+  ATT_Q.join()  # include check-ins still queued for the writer
+  with _wb_lock:
+    wb = _get_class_wb(class_id, filepath)
+    rows = _summary_rows(
+      wb["students"].iter_rows(min_row=2, max_col=4, values_only=True),
+      wb["sessions"].iter_rows(min_row=2, max_col=3, values_only=True),
+      total_sessions,
+    )
+  return [SUMMARY_HEADERS] + rows
+
 def write_summary_sheet_for_class(class_id: int):
   """Compute per-student totals across all sessions and write a clear Summary sheet.
 
@@ -298,25 +656,27 @@ def write_summary_sheet_for_class(class_id: int):
   cls = meta.get("classes", {}).get(str(class_id), {})
   total_sessions = int(cls.get("session_count", 0))
 
+  ATT_Q.join()  # include check-ins still queued for the writer
+  # the summary is written straight to the file, so the cached copy is saved
+  # and dropped first; the lock is held until the new file is in place, so
+  # the writer thread can neither reload the old file nor flush over the new one
+  with _wb_lock:
+    _flush_locked(class_id, evict=True)
+    if HAS_XLSXWRITER:
+      return _write_summary_xlsxwriter(filepath, total_sessions)
+    return _write_summary_openpyxl(filepath, total_sessions)
+
+def _write_summary_openpyxl(filepath: str, total_sessions: int) -> bool:
+  """Replace the Summary sheet of the class workbook in place with openpyxl."""
   wb = load_workbook(filepath)
   ws_students = wb["students"]
   ws_sessions = wb["sessions"]
 
-  # build mapping student_id -> (name, code)
-  students = {}
-  for r in ws_students.iter_rows(min_row=2, values_only=True):
-    sid, face, name, code, total_present = r[0], r[1], r[2], r[3], r[4] if len(r) > 4 else 0
-    students[sid] = {"name": name, "code": code, "face": face, "present": 0}
-
-  # count presents across sessions
-  session_dates = {}  # session_id -> timestamp
-  for r in ws_sessions.iter_rows(min_row=2, values_only=True):
-    sid_sess = r[0]
-    ts = r[1]
-    stuid = r[2]
-    session_dates[sid_sess] = ts
-    if stuid in students:
-      students[stuid]["present"] = students[stuid].get("present", 0) + 1
+  rows = _summary_rows(
+    ws_students.iter_rows(min_row=2, max_col=4, values_only=True),
+    ws_sessions.iter_rows(min_row=2, max_col=3, values_only=True),
+    total_sessions,
+  )
 
   # prepare or replace Summary sheet
   if "Summary" in wb.sheetnames:
@@ -325,7 +685,7 @@ def write_summary_sheet_for_class(class_id: int):
   ws = wb.create_sheet("Summary")
 
   # add header row with formatting
-  headers = ["name", "id", "date", "no_of_present", "no_of_absent", "total_class"]
+  headers = SUMMARY_HEADERS
   ws.append(headers)
 
   # format header row: bold white text on blue background
@@ -336,25 +696,8 @@ def write_summary_sheet_for_class(class_id: int):
     cell.font = header_font
     cell.alignment = Alignment(horizontal="center", vertical="center")
 
-  # choose date: most recent session date if available, else today
-  recent_date = None
-  if session_dates:
-    # find latest session id by max
-    latest_sid = max(session_dates.keys())
-    recent_date_raw = session_dates.get(latest_sid)
-    try:
-      recent_date = str(recent_date_raw).split("T")[0]
-    except Exception:
-      recent_date = str(recent_date_raw)
-  else:
-    recent_date = datetime.now().strftime("%Y-%m-%d")
-
-  for sid, info in students.items():
-    name = info.get("name") or ""
-    code = info.get("code") or ""
-    present = int(info.get("present", 0))
-    absent = max(0, total_sessions - present)
-    ws.append([name, code, recent_date, present, absent, total_sessions])
+  for row in rows:
+    ws.append(row)
 
   # format data rows: center alignment for numbers and alternate row colors
   for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=1, max_col=6):
@@ -379,13 +722,105 @@ def write_summary_sheet_for_class(class_id: int):
     adjusted_width = min(max_length + 2, 50)  # add 2 for padding, max 50
     ws.column_dimensions[col_letter].width = adjusted_width
 
-  wb.save(filepath)
+  _save_workbook(wb, filepath)
+  return True
+
+def _summary_rows(students_rows, sessions_rows, total_sessions: int) -> list:
+  """Summary sheet data rows from the students (>= 4 columns) and sessions
+  (>= 3 columns) sheet values."""
+  students = {}
+  for r in students_rows:
+    students[r[0]] = {"name": r[2], "code": r[3], "present": 0}
+
+  session_dates = {}  # session_id -> timestamp
+  for r in sessions_rows:
+    session_dates[r[0]] = r[1]
+    if r[2] in students:
+      students[r[2]]["present"] += 1
+
+  if session_dates:
+    recent_date = str(session_dates[max(session_dates.keys())]).split("T")[0]
+  else:
+    recent_date = datetime.now().strftime("%Y-%m-%d")
+
+  rows = []
+  for info in students.values():
+    present = int(info["present"])
+    rows.append([info["name"] or "", info["code"] or "", recent_date,
+                 present, max(0, total_sessions - present), total_sessions])
+  return rows
+
+def _write_summary_xlsxwriter(filepath: str, total_sessions: int) -> bool:
+  """Rebuild the class workbook with xlsxwriter, replacing its Summary sheet.
+
+  xlsxwriter cannot edit an existing file, so every other sheet is copied over
+  by value (they hold plain values only) and the new workbook replaces the old
+  one atomically. Formats are created once and applied per row.
+  """
+  wb = load_workbook(filepath, read_only=True, data_only=True)
+  try:
+    sheets = [
+      (name, [list(r) for r in wb[name].iter_rows(values_only=True)])
+      for name in wb.sheetnames if name != "Summary"
+    ]
+  finally:
+    wb.close()
+  by_name = dict(sheets)
+  headers = SUMMARY_HEADERS
+  rows = _summary_rows(by_name["students"][1:], by_name["sessions"][1:], total_sessions)
+
+  tmp = filepath + ".tmp"
+  out = xlsxwriter.Workbook(tmp, {
+    "constant_memory": True,
+    # copied datetimes stay dates (the row index only reads datetime cells),
+    # and copied text stays text instead of turning into formulas or links
+    "default_date_format": "yyyy-mm-dd hh:mm:ss",
+    "strings_to_formulas": False,
+    "strings_to_urls": False,
+  })
+  try:
+    for name, data in sheets:
+      ws = out.add_worksheet(name)
+      for r, row in enumerate(data):
+        ws.write_row(r, 0, row)
+
+    ws = out.add_worksheet("Summary")
+    # column widths must be known up front, rows are streamed straight to disk
+    for col, header in enumerate(headers):
+      width = max([len(header)] + [len(str(row[col])) for row in rows if row[col]])
+      ws.set_column(col, col, min(width + 2, 50))
+    header_fmt = out.add_format({"bold": True, "font_color": "#FFFFFF", "bg_color": "#0070C0",
+                                 "align": "center", "valign": "vcenter"})
+    data_fmt = out.add_format({"align": "center", "valign": "vcenter"})
+    band_fmt = out.add_format({"align": "center", "valign": "vcenter", "bg_color": "#E7E6E6"})
+    ws.write_row(0, 0, headers, header_fmt)
+    for r, row in enumerate(rows, start=1):
+      # alternate row colors for readability (even spreadsheet rows are shaded)
+      ws.write_row(r, 0, row, band_fmt if r % 2 else data_fmt)
+  finally:
+    out.close()
+  os.replace(tmp, filepath)
   return True
 
 # face helpers
 _face_app = None
 _last_log_times: Dict[str, float] = {}
 
+def _ort_providers() -> list:
+  """ONNX Runtime execution providers to use, best available first.
+
+  Passed explicitly so a GPU/CoreML build of onnxruntime is actually used
+  instead of whatever insightface defaults to.
+  """
+  try:
+    import onnxruntime as ort
+    available = set(ort.get_available_providers())
+  except Exception:
+    return ["CPUExecutionProvider"]
+  preferred = ("CUDAExecutionProvider", "OpenVINOExecutionProvider", "CoreMLExecutionProvider",
+               "CPUExecutionProvider")
+  return [p for p in preferred if p in available] or ["CPUExecutionProvider"]
+
 def face_app():
   """Return the insightface FaceAnalysis instance or raise if not available."""
   global _face_app
@@ -394,67 +829,477 @@ def face_app():
       "insightface is not installed or failed to import. Install insightface or run in an environment where it's available."
     )
   if _face_app is None:
-    _face_app = FaceAnalysis(name="buffalo_l")
+    _face_app = FaceAnalysis(name="buffalo_l", providers=_ort_providers())
     _face_app.prepare(ctx_id=0, det_size=DET_SIZE)
+    # one dummy pass so session/provider setup is not paid by the first real frame
+    _face_app.get(np.zeros((DET_SIZE[1], DET_SIZE[0], 3), dtype=np.uint8))
   return _face_app
 
-def norm_cos(a: np.ndarray, b: np.ndarray) -> float:
-    a = a / np.linalg.norm(a)
-    b = b / np.linalg.norm(b)
-    return float(np.dot(a, b))
-
+@lru_cache(maxsize=4096)
 def parse_label(label: str):
-    return label.split("_", 1) if "_" in label else (label, label)
-
-def data_url_to_bgr(data_url: str) -> np.ndarray | None:
-    m = re.match(r"^data:image/(png|jpeg);base64,(.+)$", data_url or "")
-    if not m:
+    # cached: the same few hundred labels come back on every check-in
+    code, sep, name = label.partition("_")
+    return (code, name) if sep else (label, label)
+
+# accepted data URL headers (jpeg first: it is what the page sends)
+_DATA_URL_PREFIXES = ("data:image/jpeg;base64,", "data:image/png;base64,")
+
+def data_url_to_bgr(data_url: str, reduced: bool = False) -> np.ndarray | None:
+    # reduced=True is for frames that are only matched, never saved: oversized
+    # ones are shrunk to MAX_FRAME_SIDE (very large payloads already at decode).
+    # Normal page frames stay at full size, since the recognition crop is cut
+    # from this image and must match the full-size enrollment photos
+    data_url = data_url or ""
+    if not data_url.startswith(_DATA_URL_PREFIXES):
+        return None
+    b64 = data_url.partition(",")[2]
+    if not b64:
         return None
-    raw = base64.b64decode(m.group(2))
-    nparr = np.frombuffer(raw, np.uint8)
-    return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    raw = b64decode(b64, validate=False)
+    img = decode_image(raw, reduced and len(raw) > REDUCED_DECODE_BYTES)
+    if img is None or not reduced:
+        return img
+    return fit_frame(img)
+
+def decode_image(buf, reduced: bool = False) -> np.ndarray | None:
+    """Decode encoded image bytes to BGR; `reduced=True` decodes at half size.
+
+    JPEGs go through PyTurboJPEG when it is installed (scaling inside the
+    decoder, like IMREAD_REDUCED_COLOR_2); anything else, or a JPEG it
+    rejects, through cv2.imdecode.
+    """
+    arr = np.frombuffer(buf, np.uint8)
+    if HAS_TURBOJPEG and arr[:2].tobytes() == b"\xff\xd8":
+        try:
+            return _turbojpeg.decode(arr, pixel_format=TJPF_BGR,
+                                     scaling_factor=(1, 2) if reduced else None)
+        except Exception:
+            pass
+    return cv2.imdecode(arr, cv2.IMREAD_REDUCED_COLOR_2 if reduced else cv2.IMREAD_COLOR)
+
+def fit_frame(img: np.ndarray, max_side: int = MAX_FRAME_SIDE) -> np.ndarray:
+    """Downscale `img` so its longer side is at most `max_side` pixels.
+
+    The detector works at DET_SIZE anyway; shrinking big camera frames first
+    keeps the rest of the preprocessing from touching every source pixel.
+    """
+    h, w = img.shape[:2]
+    scale = max_side / max(h, w)
+    if scale >= 1.0:
+        return img
+    return cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+
+# .jpg frames per capture folder -> (count, folder mtime_ns after our last save).
+# A different mtime means something else (Streamlit, another process) changed
+# the folder since, so it is listed again instead of trusting the count
+_frame_counts: Dict[str, tuple] = {}
+_frame_lock = threading.Lock()
+
+def _count_frames(folder: str) -> int:
+    with os.scandir(folder) as it:
+        return sum(1 for e in it if e.name.endswith(".jpg"))
+
+def save_frame(folder: str, img: np.ndarray) -> int:
+    """Save `img` as a new .jpg in `folder`; returns the folder's frame count."""
+    Path(folder).mkdir(parents=True, exist_ok=True)
+    # encoded outside the lock: only naming, writing and counting are serialized
+    ok, buf = cv2.imencode(".jpg", img)
+    with _frame_lock:
+        cached = _frame_counts.get(folder)
+        fresh = cached is not None and cached[1] == os.stat(folder).st_mtime_ns
+        stamp = int(time.time() * 1000)
+        out = os.path.join(folder, f"{stamp}.jpg")
+        while os.path.exists(out):
+            # another frame took this millisecond: use the next free name and
+            # recount, in case it came from outside this process
+            stamp += 1
+            out = os.path.join(folder, f"{stamp}.jpg")
+            fresh = False
+        if ok:
+            buf.tofile(out)
+        count = cached[0] + int(ok) if fresh else _count_frames(folder)
+        _frame_counts[folder] = (count, os.stat(folder).st_mtime_ns)
+        return count
+
+# centroids kept in memory and reloaded only when their files change on disk
+_centroids: Dict[str, np.ndarray] | None = None
+_centroids_stamp = None
+# the same centroids as unit-norm (N, D) float32 rows (row i is _centroid_labels[i]),
+# set together with them; plus search structures built lazily and dropped
+# whenever the centroids change: the rows' int8 quantization (codes, per-row
+# scale) for SimSIMD and, when faiss is the backend, an index over them
+_centroid_labels: list = []
+_centroid_matrix = None
+_centroid_q8 = None
+_faiss_index = None
+
+def _centroids_stamp_now():
+    stamp = []
+    for p in (CENTROIDS_NPY, CENTROID_LABELS, CENTROIDS):
+        try:
+            stamp.append(_file_stamp(p))
+        except OSError:
+            stamp.append(None)
+    return tuple(stamp)
 
 def load_centroids() -> Dict[str, np.ndarray]:
-    if not os.path.exists(CENTROIDS):
-        return {}
-    with open(CENTROIDS, "r") as f:
-        data = json.load(f).get("centroids", {})
-    return {k: np.array(v, dtype=np.float32) for k, v in data.items()}
+    """Return label -> centroid. Reads centroids.npy + centroid_labels.json; a
+    legacy centroids.json found instead is converted to that layout and removed."""
+    global _centroids_stamp
+    stamp = _centroids_stamp_now()
+    if _centroids is not None and stamp == _centroids_stamp:
+        return _centroids
+    npy_stamp, labels_stamp, json_stamp = stamp
+    if npy_stamp and labels_stamp:
+        # stored as float16 to halve the file; arithmetic stays in float32. The
+        # mapping lets the conversion read the file directly, without a float16 copy
+        mat = np.load(CENTROIDS_NPY, mmap_mode="r").astype(np.float32)
+        with open(CENTROID_LABELS, "r") as f:
+            labels = json.load(f)
+    elif json_stamp:
+        with open(CENTROIDS, "r") as f:
+            data = json.load(f).get("centroids", {})
+        if data:
+            # one-time migration: later loads take the matrix path above
+            save_centroids({k: np.array(v, dtype=np.float32) for k, v in data.items()})
+            os.remove(CENTROIDS)
+            _centroids_stamp = _centroids_stamp_now()
+            return _centroids
+        labels, mat = [], None
+    else:
+        labels, mat = [], None
+    _set_centroids(labels, mat)
+    _centroids_stamp = stamp
+    return _centroids
+
+def _set_centroids(labels: list, mat: np.ndarray | None):
+    """Install `labels` and their (N, D) float32 matrix as the current centroids.
+
+    The matrix is what matching scans; the label -> centroid dict handed out
+    by load_centroids only holds views of its rows.
+    """
+    global _centroids, _centroid_labels, _centroid_matrix, _centroid_q8, _faiss_index
+    if labels and mat is not None and mat.size:
+        # unit-normalized once here, so every comparison is a plain dot product
+        mat = np.ascontiguousarray(mat, dtype=np.float32)
+        mat /= np.linalg.norm(mat, axis=1, keepdims=True) + 1e-12
+        _centroid_labels, _centroid_matrix = list(labels), mat
+    else:
+        _centroid_labels, _centroid_matrix = [], None
+    _centroids = {k: _centroid_matrix[i] for i, k in enumerate(_centroid_labels)}
+    _centroid_q8 = _faiss_index = None
 
 def save_centroids(cents: Dict[str, np.ndarray]):
-    with open(CENTROIDS, "w") as f:
-        json.dump({"centroids": {k: v.tolist() for k, v in cents.items()}}, f)
+    global _centroids_stamp
+    labels = list(cents)
+    if labels:
+        mat = np.stack([cents[k] for k in labels]).astype(np.float32)
+        mat /= np.linalg.norm(mat, axis=1, keepdims=True) + 1e-12
+    else:
+        mat = np.zeros((0, 0), dtype=np.float32)
+    # write to temp files and swap them in so readers never see a half-written matrix
+    _ensure_dir(MODELS_DIR)
+    with open(CENTROIDS_NPY + ".tmp", "wb") as f:
+        np.save(f, mat.astype(np.float16))
+    with open(CENTROID_LABELS + ".tmp", "w") as f:
+        json.dump(labels, f)
+    os.replace(CENTROIDS_NPY + ".tmp", CENTROIDS_NPY)
+    os.replace(CENTROID_LABELS + ".tmp", CENTROID_LABELS)
+    _set_centroids(labels, mat)
+    _centroids_stamp = _centroids_stamp_now()
+
+def _get_centroid_matrix():
+    """Return (labels, unit-norm float32 matrix) for the current centroids."""
+    load_centroids()
+    return _centroid_labels, _centroid_matrix
+
+def quantize_rows(M: np.ndarray):
+    """Symmetric int8 quantization per row: returns (codes, scale) with M ~= codes * scale[:, None]."""
+    scale = np.abs(M).max(axis=1) / 127.0
+    scale[scale == 0] = 1.0
+    codes = np.round(M / scale[:, None]).astype(np.int8)
+    return codes, scale.astype(np.float32)
+
+def _get_centroid_q8():
+    """Return (labels, (int8 codes, scale)) for the current centroids."""
+    global _centroid_q8
+    labels, mat = _get_centroid_matrix()
+    if _centroid_q8 is None and mat is not None:
+        _centroid_q8 = quantize_rows(mat)
+    return labels, _centroid_q8
+
+def _get_faiss_index():
+    """Return (index, labels) for the current centroids, building the index on first use."""
+    global _faiss_index
+    labels, mat = _get_centroid_matrix()
+    if _faiss_index is None and mat is not None:
+        # fp16 codes, like centroids.npy, halve the bytes scanned per query;
+        # similarities stay in [-1, 1]. IVF is not worth it at the gallery
+        # sizes one deployment produces
+        idx = faiss.IndexScalarQuantizer(
+            mat.shape[1], faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT
+        )
+        idx.add(mat)
+        _faiss_index = idx
+    return _faiss_index, labels
+
+# gallery size from which match_centroid hands the search to an index-style
+# backend (SimSIMD int8 codes or faiss) instead of float32 dot products, and
+# from which the numba kernels pay off: below it a plain matmul is cheaper
+# than entering compiled code
+SMALL_GALLERY = 32
+
+if HAS_NUMBA:
+    # explicit signatures: compiled once at import (and cached on disk) for the
+    # contiguous float32 layout _get_centroid_matrix produces, so calls skip
+    # type dispatch. The argmax is folded into the dot-product loop: no
+    # similarity array is allocated and only the running best leaves the kernel
+    @njit("Tuple((int64, float32))(float32[::1], float32[:, ::1])", fastmath=True, cache=True, boundscheck=False)
+    def _best_cosine_kernel(q, M):
+        best_i = -1
+        best_s = np.float32(-2.0)
+        for i in range(M.shape[0]):
+            s = np.float32(0.0)
+            for k in range(M.shape[1]):
+                s += q[k] * M[i, k]
+            if s > best_s:
+                best_s = s
+                best_i = i
+        return best_i, best_s
+
+    # buffalo_l embeddings are always 512-d; with the width a literal, the loop
+    # has no tail and four independent accumulators keep the FMA units busy.
+    # Serial on purpose: at classroom gallery sizes thread start-up costs more
+    # than it saves
+    @njit("Tuple((int64, float32))(float32[::1], float32[:, ::1])", fastmath=True, cache=True, boundscheck=False)
+    def _best_cosine_512_kernel(q, M):
+        best_i = -1
+        best_s = np.float32(-2.0)
+        for i in range(M.shape[0]):
+            a0 = a1 = a2 = a3 = np.float32(0.0)
+            for k in range(0, 512, 4):
+                a0 += q[k] * M[i, k]
+                a1 += q[k + 1] * M[i, k + 1]
+                a2 += q[k + 2] * M[i, k + 2]
+                a3 += q[k + 3] * M[i, k + 3]
+            s = (a0 + a1) + (a2 + a3)
+            if s > best_s:
+                best_s = s
+                best_i = i
+        return best_i, best_s
+
+def cosines(q: np.ndarray, M: np.ndarray) -> np.ndarray:
+    """Cosine similarity of unit vector `q` against every unit-norm row of `M`.
+
+    `M` must be a C-contiguous float32 matrix, as built by _get_centroid_matrix.
+    """
+    if HAS_SIMSIMD:
+        # rows and q are unit-norm, so the dot product is the cosine
+        return np.asarray(simsimd.cdist(q[None, :], M, metric="dot"), dtype=np.float32)[0]
+    return M @ q
+
+def best_cosine(q: np.ndarray, M: np.ndarray) -> tuple[int, float]:
+    """(row index, cosine) of the row of `M` closest to unit vector `q`; same
+    layout requirements as cosines().
+
+    The numba kernels from SMALL_GALLERY rows up (match_centroid only sends
+    such galleries here when neither SimSIMD nor faiss is installed), else
+    cosines() and argmax.
+    """
+    if HAS_NUMBA and M.shape[0] >= SMALL_GALLERY:
+        q = np.ascontiguousarray(q, dtype=np.float32)
+        if M.shape[1] == 512:
+            i, s = _best_cosine_512_kernel(q, M)
+        else:
+            i, s = _best_cosine_kernel(q, M)
+        return int(i), float(s)
+    sims = cosines(q, M)
+    i = int(np.argmax(sims))
+    return i, float(sims[i])
+
+if HAS_NUMBA:
+    @njit(cache=True, fastmath=True)
+    def _unit_mean_kernel(E):
+        # column sums in one sweep over the rows, then scale to unit length;
+        # the mean's direction is the sum's, so the 1/N factor is never applied
+        acc = np.zeros(E.shape[1], dtype=np.float32)
+        for i in range(E.shape[0]):
+            for k in range(E.shape[1]):
+                acc[k] += E[i, k]
+        s = np.float32(0.0)
+        for k in range(acc.shape[0]):
+            s += acc[k] * acc[k]
+        return acc / (np.sqrt(s) + np.float32(1e-12))
+
+def unit_mean(E: np.ndarray) -> np.ndarray:
+    """Unit-norm mean of the rows of the (N, D) matrix `E`, as float32."""
+    E = np.ascontiguousarray(E, dtype=np.float32)
+    if HAS_NUMBA:
+        return _unit_mean_kernel(E)
+    m = E.sum(axis=0)
+    return m / (np.linalg.norm(m) + 1e-12)
+
+if HAS_NUMBA:
+    @njit(cache=True, fastmath=True)
+    def _pairwise_stats_kernel(E):
+        # every i < j dot product once, folded into sum and sum of squares;
+        # serial: a registration has ~15 photos, far too few pairs for threads
+        n = E.shape[0]
+        total = 0.0
+        total_sq = 0.0
+        for i in range(n):
+            for j in range(i + 1, n):
+                s = np.float32(0.0)
+                for k in range(E.shape[1]):
+                    s += E[i, k] * E[j, k]
+                total += s
+                total_sq += s * s
+        pairs = n * (n - 1) // 2
+        mean = total / pairs
+        return mean, np.sqrt(max(total_sq / pairs - mean * mean, 0.0))
+
+def pairwise_cos_stats(E: np.ndarray) -> tuple[float, float]:
+    """(mean, std) of the cosine similarity over all pairs of rows of `E`.
+
+    Rows must be unit-norm, as folder_embeddings returns them; (0.0, 0.0) when
+    there are fewer than two rows.
+    """
+    E = np.ascontiguousarray(E, dtype=np.float32)
+    if E.shape[0] < 2:
+        return 0.0, 0.0
+    if HAS_NUMBA:
+        mean, std = _pairwise_stats_kernel(E)
+        return float(mean), float(std)
+    sims = (E @ E.T)[np.triu_indices(E.shape[0], k=1)]
+    return float(sims.mean()), float(sims.std())
+
+def match_centroid(emb: np.ndarray) -> tuple[str, float]:
+    """Return (best_label, cosine similarity) of `emb` against the stored centroids.
+
+    `emb` must already be unit-norm, as normed_embedding and compute_image_feature are.
+    """
+    q = np.asarray(emb, dtype=np.float32)
+    # backends, first installed wins:
+    #   fewer than SMALL_GALLERY centroids: float32 dot products through
+    #   best_cosine (SimSIMD, else numpy)
+    #   SMALL_GALLERY and up: SimSIMD int8 codes, else the faiss fp16 index,
+    #   else best_cosine's fused numba kernels, else numpy
+    labels, mat = _get_centroid_matrix()
+    if mat is None:
+        return "Unknown", -1.0
+    if len(labels) >= SMALL_GALLERY:
+        if HAS_SIMSIMD:
+            # int8 dot products (VNNI/NEON in SimSIMD) rescaled back to cosines;
+            # quantization error is ~1e-3, far below the match threshold's margin
+            labels, (codes, scale) = _get_centroid_q8()
+            q_codes, q_scale = quantize_rows(q[None, :])
+            sims = np.asarray(simsimd.cdist(q_codes, codes, metric="dot"))[0] * (scale * q_scale[0])
+            i = int(np.argmax(sims))
+            return labels[i], float(sims[i])
+        if HAS_FAISS:
+            idx, labels = _get_faiss_index()
+            D, I = idx.search(q.reshape(1, -1), 1)
+            return labels[int(I[0, 0])], float(D[0, 0])
+    i, s = best_cosine(q, mat)
+    return labels[i], s
+
+def read_images(paths: list) -> list:
+  """Decode each of `paths` with cv2.imread; None where a file does not decode."""
+  # cv2.imread releases the GIL, so a small pool overlaps disk reads and decodes
+  if not paths:
+    return []
+  with ThreadPoolExecutor(max_workers=min(8, len(paths))) as pool:
+    return list(pool.map(cv2.imread, paths))
+
+def _read_images(folder: str) -> list:
+  paths = [str(p) for p in Path(folder).glob("*") if p.is_file()]
+  return [img for img in read_images(paths) if img is not None]
+
+def _face_embeddings(imgs: list) -> tuple[np.ndarray | None, list]:
+  """Normalized embeddings of the largest face in each image, shape (B, D),
+  and the indices into `imgs` of the B images they came from.
+
+  The detector still runs per image, but the recognition model runs once over
+  the whole batch of aligned crops (and the landmark/attribute models that
+  app.get would also run are skipped).
+  """
+  from insightface.utils import face_align
+  try:
+    app = face_app()
+    rec = app.models["recognition"]
+  except Exception:
+    return None, []
+  crops, kept = [], []
+  for i, img in enumerate(imgs):
+    try:
+      bboxes, kpss = app.det_model.detect(img, max_num=0, metric="default")
+    except Exception:
+      continue
+    if bboxes is None or len(bboxes) == 0 or kpss is None:
+      continue
+    areas = (bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1])
+    kps = kpss[int(np.argmax(areas))]
+    crops.append(face_align.norm_crop(img, landmark=kps, image_size=rec.input_size[0]))
+    kept.append(i)
+  if not crops:
+    return None, []
+  try:
+    feats = np.asarray(rec.get_feat(crops), dtype=np.float32).reshape(len(crops), -1)
+  except Exception:
+    return None, []
+  feats /= np.linalg.norm(feats, axis=1, keepdims=True)
+  return feats, kept
+
+def image_embeddings(imgs: list) -> list:
+  """Unit-norm embedding of each image in `imgs`; None where an image is None
+  or yields no face.
+
+  With insightface the recognition model runs once over the whole batch (see
+  _face_embeddings); otherwise each image gets the fallback feature.
+  """
+  out = [None] * len(imgs)
+  valid = [i for i, img in enumerate(imgs) if img is not None]
+  if not valid:
+    return out
+  if HAS_INSIGHTFACE:
+    feats, kept = _face_embeddings([imgs[i] for i in valid])
+    for row, k in enumerate(kept):
+      out[valid[k]] = feats[row]
+    return out
+  for i in valid:
+    out[i] = compute_image_feature(imgs[i])
+  return out
+
+def folder_embeddings(folder: str) -> np.ndarray | None:
+  """Unit-norm embeddings, shape (B, D), of the images in `folder` that yield one."""
+  feats = [f for f in image_embeddings(_read_images(folder)) if f is not None]
+  return np.stack(feats) if feats else None
 
 def compute_centroid_for_folder(folder: str) -> np.ndarray | None:
   # If insightface is available use it to extract per-face normalized embeddings.
   # Otherwise fall back to a simple image feature so data flows (create/register) work.
-  embs = []
-  for p in Path(folder).glob("*"):
-    if not p.is_file():
-      continue
-    img = cv2.imread(str(p))
-    if img is None:
-      continue
-    if HAS_INSIGHTFACE:
-      try:
-        app = face_app()
-        faces = app.get(img)
-      except Exception:
-        faces = []
-      if not faces:
-        continue
-      f = max(
-        faces,
-        key=lambda z: (z.bbox[2] - z.bbox[0]) * (z.bbox[3] - z.bbox[1]),
-      )
-      embs.append(f.normed_embedding.astype(np.float32))
-    else:
-      feat = compute_image_feature(img)
-      if feat is not None:
-        embs.append(feat.astype(np.float32))
-  if not embs:
+  # The centroid is returned unit-norm, ready for inner-product search.
+  feats = folder_embeddings(folder)
+  if feats is None:
     return None
-  return np.mean(embs, axis=0)
+  return unit_mean(feats)
+
+if HAS_NUMBA:
+  @njit(parallel=True, cache=True, fastmath=True)
+  def _feature_kernel(r):
+    # uint8 (H, W) -> flattened float32 vector scaled to unit length; the /255
+    # of the original formulation cancels out under the normalization
+    h, w = r.shape
+    v = np.empty(h * w, dtype=np.float32)
+    ss = 0.0
+    for i in prange(h):
+      row_ss = 0.0
+      for j in range(w):
+        x = np.float32(r[i, j])
+        v[i * w + j] = x
+        row_ss += x * x
+      ss += row_ss
+    return v, np.sqrt(ss)
 
 def compute_image_feature(img: np.ndarray) -> np.ndarray | None:
   """Fallback feature extractor: resize, grayscale, histogram/flattened normalized vector.
@@ -464,6 +1309,12 @@ def compute_image_feature(img: np.ndarray) -> np.ndarray | None:
     # convert to grayscale and resize to fixed size
     g = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     r = cv2.resize(g, (128, 128), interpolation=cv2.INTER_LINEAR)
+    if HAS_NUMBA:
+      v, norm = _feature_kernel(r)
+      if norm <= 1e-6:
+        return None
+      v /= np.float32(norm)
+      return v
     # normalize to [0,1]
     v = r.astype(np.float32).ravel() / 255.0
     # L2-normalize
@@ -477,6 +1328,9 @@ def compute_image_feature(img: np.ndarray) -> np.ndarray | None:
 # flask application
 app = Flask(__name__)
 ensure_reports_setup()
+if HAS_NUMBA and not HAS_INSIGHTFACE:
+  # compile (or load from cache) the fallback feature kernel now, not on the first request
+  compute_image_feature(np.zeros((8, 8, 3), dtype=np.uint8) + 1)
 
 INDEX_HTML = """
 <!doctype html>
@@ -857,10 +1711,7 @@ def api_save_prof_frame():
 
     label = f"prof_{prof_code}_{prof_name}"
     folder = os.path.join(DATA_DIR, label)
-    Path(folder).mkdir(parents=True, exist_ok=True)
-    out = os.path.join(folder, f"{int(time.time() * 1000)}.jpg")
-    cv2.imwrite(out, img)
-    n = len(list(Path(folder).glob("*.jpg")))
+    n = save_frame(folder, img)
     return jsonify(ok=True, message=f"Saved frame for professor. Total frames: {n}")
 
 
@@ -919,10 +1770,7 @@ def api_save_student_frame():
 
     label = f"{student_code}_{student_name}"
     folder = os.path.join(DATA_DIR, label)
-    Path(folder).mkdir(parents=True, exist_ok=True)
-    out = os.path.join(folder, f"{int(time.time() * 1000)}.jpg")
-    cv2.imwrite(out, img)
-    n = len(list(Path(folder).glob("*.jpg")))
+    n = save_frame(folder, img)
     return jsonify(ok=True, message=f"Saved frame for student. Total frames: {n}")
 
 
@@ -968,17 +1816,7 @@ def api_register_student():
     if not filepath or not os.path.exists(filepath):
       return jsonify(ok=False, error="Class workbook not found"), 500
 
-    wb = load_workbook(filepath)
-    ws_students = wb["students"]
-
-    exists = False
-    for r in ws_students.iter_rows(min_row=2, values_only=True):
-      if r[1] == label or r[0] == student_id:
-        exists = True
-        break
-    if not exists:
-      ws_students.append([student_id, label, student_name, student_code, 0])
-      wb.save(filepath)
+    add_student_to_class(class_id, filepath, student_id, label, student_name, student_code)
 
     msg = f"Student registered and linked to class {class_id}."
     return jsonify(ok=True, message=msg)
@@ -990,7 +1828,7 @@ def api_open_class():
     data = request.get_json(force=True)
     data_url = data.get("dataUrl") or ""
 
-    img = data_url_to_bgr(data_url)
+    img = data_url_to_bgr(data_url, reduced=True)
     if img is None:
         return jsonify(ok=False, error="No image"), 400
 
@@ -1017,11 +1855,7 @@ def api_open_class():
       if emb is None:
         return jsonify(ok=False, error="Could not compute fallback image feature"), 200
 
-    best_lab, best_sim = "Unknown", -1.0
-    for lab, c in cents.items():
-        s = norm_cos(emb, c)
-        if s > best_sim:
-            best_sim, best_lab = s, lab
+    best_lab, best_sim = match_centroid(emb)
 
     if best_sim < THRESHOLD or not best_lab.startswith("prof_"):
         return jsonify(ok=False, error="Professor not recognized"), 200
@@ -1042,10 +1876,7 @@ def api_open_class():
     # append session row in workbook
     filepath = cls.get("file")
     if filepath and os.path.exists(filepath):
-      wb = load_workbook(filepath)
-      ws_sessions = wb["sessions"]
-      ws_sessions.append([session_id, datetime.now().isoformat(), "", "", "", ""])
-      wb.save(filepath)
+      add_session_row(class_id, filepath, session_id)
 
     msg = f"Welcome Professor. Class opened: {class_name} (id {class_id})"
     return jsonify(ok=True, classId=class_id, className=class_name, message=msg)
@@ -1063,7 +1894,7 @@ def api_check_student():
     except (TypeError, ValueError):
         return jsonify(ok=False, error="Invalid class id"), 400
 
-    img = data_url_to_bgr(data_url)
+    img = data_url_to_bgr(data_url, reduced=True)
     if img is None:
         return jsonify(ok=False, error="No image"), 400
 
@@ -1086,13 +1917,11 @@ def api_check_student():
       if emb is None:
         return jsonify(ok=True, status="No face detected", detail=""), 200
 
-    best_lab, best_sim = "Unknown", -1.0
-    for lab, c in cents.items():
-        s = norm_cos(emb, c)
-        if s > best_sim:
-            best_sim, best_lab = s, lab
+    best_lab, best_sim = match_centroid(emb)
 
-    ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # one clock read: the stored check-in time matches the one shown
+    dt = datetime.now()
+    ts = dt.strftime("%Y-%m-%d %H:%M:%S")
 
     if best_sim < THRESHOLD:
         return jsonify(
@@ -1115,7 +1944,7 @@ def api_check_student():
         return jsonify(ok=True, status=status, detail=detail)
 
     class_name, student_name, student_code, recorded = mark_student_attendance(
-      best_lab, class_id
+      best_lab, class_id, dt
     )
     _last_log_times[best_lab] = now
 
@@ -1155,5 +1984,7 @@ def api_summary():
 
 
 if __name__ == "__main__":
+    if HAS_INSIGHTFACE:
+        face_app()  # load and warm the models before serving
     # run with: python src/dashboard.py
     app.run(host="127.0.0.1", port=50135, debug=True)
\ No newline at end of file
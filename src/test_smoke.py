@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 """Smoke-test: create a sample class Excel workbook and exercise duplicate check logic.
 
-This script does not depend on insightface or OpenCV — it only requires openpyxl.
+The sample workbook part does not depend on insightface or OpenCV — it only requires
+openpyxl. The `test_*` checks below drive index.py itself (OpenCV, Flask and numpy, but
+not insightface) against a temporary data folder: queued check-ins, the debounced
+workbook flush, centroid migration, matching backends and the Summary rewrite.
 Run with the project's venv activated:
 
   python src/test_smoke.py
@@ -9,9 +12,16 @@ Run with the project's venv activated:
 It writes `excel_reports/smoke_test_class.xlsx` and attempts to mark the same student twice
 to demonstrate duplicate-prevention logic.
 """
+import json
+import sys
+import tempfile
+import threading
+import time
 from pathlib import Path
-from datetime import date
-from openpyxl import Workbook
+from datetime import date, datetime
+
+import numpy as np
+from openpyxl import Workbook, load_workbook
 from openpyxl.styles import Font, PatternFill, Alignment
 
 ROOT = Path(__file__).resolve().parents[1]
@@ -65,3 +75,192 @@ summary.append(["Test Student", "S001", date.today().isoformat(), 1, 0, 1])
 
 wb.save(FILE)
 print(f"Smoke test workbook written to: {FILE}")
+
+
+# --- checks against index.py ---------------------------------------------------
+
+def _load_index(tmp: Path):
+    """Import index.py with its storage pointed at `tmp`, so real data is never touched.
+
+    It is imported as `src.index`, the way streamlit_app.py does, so the numba kernels
+    cached under src/__pycache__ stay valid for the dashboard.
+    """
+    sys.path.insert(0, str(ROOT))
+    from src import index as core
+
+    core.REPORTS_DIR = str(tmp / "excel_reports")
+    core.MODELS_DIR = str(tmp / "models")
+    core.CLASSES_META = str(tmp / "models" / "classes_meta.json")
+    core.STUDENTS_META = str(tmp / "models" / "students_meta.json")
+    core.CENTROIDS = str(tmp / "models" / "centroids.json")
+    core.CENTROIDS_NPY = str(tmp / "models" / "centroids.npy")
+    core.CENTROID_LABELS = str(tmp / "models" / "centroid_labels.json")
+    core.flush_class_workbooks(evict=True)
+    core._meta_cache.clear()
+    core._class_row_index.clear()
+    core._centroids = core._centroids_stamp = None
+    core.WB_FLUSH_S, core.WB_IDLE_S = 0.05, 120.0  # no flush timer outlives its test
+    return core
+
+
+def _open_smoke_class(core):
+    """Create a class with session 1 open, as /api/create_class and /api/open_class do."""
+    cid = core.create_class("prof_P1_Smoke", "Smoke", "P1", "smoke")
+    meta = core.load_classes_meta()
+    cls = meta["classes"][str(cid)]
+    cls["session_count"] = 1
+    core.save_classes_meta(meta)
+    core.add_session_row(cid, cls["file"], 1)
+    return cid, cls["file"]
+
+
+def test_summary_during_checkins():
+    with tempfile.TemporaryDirectory() as tmp:
+        core = _load_index(Path(tmp))
+        # flush almost at once, so timer saves land inside the summary rewrites
+        core.WB_FLUSH_S, flush_s = 0.001, core.WB_FLUSH_S
+        cid, path = _open_smoke_class(core)
+        labels = [f"S{i:03d}_Student {i}" for i in range(200)]
+
+        def checkins():
+            for lab in labels:
+                core.mark_student_attendance(lab, cid)
+                time.sleep(0.002)  # spread out like real check-ins
+
+        t = threading.Thread(target=checkins, daemon=True)
+        t.start()
+        while t.is_alive():
+            core.write_summary_sheet_for_class(cid)
+        t.join()
+        core.write_summary_sheet_for_class(cid)
+        core.WB_FLUSH_S = flush_s
+
+        wb = load_workbook(path, read_only=True)
+        checked_in = {r[3] for r in wb["sessions"].iter_rows(min_row=2, values_only=True) if r[2]}
+        summary = list(wb["Summary"].iter_rows(min_row=2, values_only=True))
+        wb.close()
+        # no check-in lost to a summary rewrite, and the last summary saw them all
+        assert checked_in == set(labels), len(checked_in)
+        assert len(summary) == len(labels)
+
+
+def _sessions_rows(path):
+    wb = load_workbook(path, read_only=True)
+    rows = [r for r in wb["sessions"].iter_rows(min_row=2, values_only=True) if r[2]]
+    wb.close()
+    return rows
+
+
+def test_checkins_go_through_writer():
+    with tempfile.TemporaryDirectory() as tmp:
+        core = _load_index(Path(tmp))
+        cid, path = _open_smoke_class(core)
+        assert core.mark_student_attendance("S001_Ann Lee", cid)[3] is True
+        # the duplicate is caught from the row index, before the first row is written
+        assert core.mark_student_attendance("S001_Ann Lee", cid)[3] is False
+        core.ATT_Q.join()
+        ws = core._wb_cache[cid]["wb"]["sessions"]
+        assert [r[3] for r in ws.iter_rows(min_row=2, values_only=True) if r[2]] == ["S001_Ann Lee"]
+        core.flush_class_workbooks(cid)
+        assert [r[3] for r in _sessions_rows(path)] == ["S001_Ann Lee"]
+
+
+def test_workbook_flush_is_debounced():
+    with tempfile.TemporaryDirectory() as tmp:
+        core = _load_index(Path(tmp))
+        core.WB_FLUSH_S = 0.5
+        cid, path = _open_smoke_class(core)
+        core.mark_student_attendance("S001_Ann Lee", cid)
+        core.ATT_Q.join()
+        assert _sessions_rows(path) == []  # held in memory until the timer fires
+        time.sleep(1.0)
+        assert len(_sessions_rows(path)) == 1
+        assert cid in core._wb_cache
+
+        # a cached workbook unused for WB_IDLE_S is dropped when the timer next fires
+        core.WB_FLUSH_S, core.WB_IDLE_S = 0.05, 0.0
+        core.mark_student_attendance("S002_Bo Chan", cid)
+        core.ATT_Q.join()
+        time.sleep(0.5)
+        assert cid not in core._wb_cache
+        assert len(_sessions_rows(path)) == 2
+
+
+def test_legacy_centroids_json_migrates():
+    with tempfile.TemporaryDirectory() as tmp:
+        core = _load_index(Path(tmp))
+        rng = np.random.default_rng(0)
+        legacy = {f"S{i:03d}_Student {i}": rng.standard_normal(512).tolist() for i in range(3)}
+        Path(core.MODELS_DIR).mkdir(parents=True)
+        Path(core.CENTROIDS).write_text(json.dumps({"centroids": legacy}))
+
+        cents = core.load_centroids()
+        assert not Path(core.CENTROIDS).exists()
+        assert Path(core.CENTROIDS_NPY).exists() and Path(core.CENTROID_LABELS).exists()
+        assert list(cents) == list(legacy)
+        for label, vec in legacy.items():
+            vec = np.asarray(vec, dtype=np.float32)
+            assert np.allclose(cents[label], vec / np.linalg.norm(vec), atol=1e-3)
+
+        # a fresh process reads the converted files
+        core._centroids = core._centroids_stamp = None
+        assert list(core.load_centroids()) == list(legacy)
+
+
+def test_match_backends_agree():
+    with tempfile.TemporaryDirectory() as tmp:
+        core = _load_index(Path(tmp))
+        rng = np.random.default_rng(1)
+        labels = [f"S{i:03d}_Student {i}" for i in range(2 * core.SMALL_GALLERY)]
+        core.save_centroids({lab: rng.standard_normal(512) for lab in labels})
+        _, mat = core._get_centroid_matrix()
+        queries = mat[::7] + 0.5 * rng.standard_normal((len(mat[::7]), 512)).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+        flags = ("HAS_SIMSIMD", "HAS_FAISS", "HAS_NUMBA")
+        installed = {f: getattr(core, f) for f in flags}
+        try:
+            for f in flags:
+                setattr(core, f, False)
+            expected = [core.match_centroid(q) for q in queries]
+            for f in flags:
+                if not installed[f]:
+                    continue
+                setattr(core, f, True)  # int8 codes, fp16 index or numba kernels
+                for q, (label, score) in zip(queries, expected):
+                    got_label, got_score = core.match_centroid(q)
+                    assert got_label == label, (f, got_label, label)
+                    assert abs(got_score - score) < 2e-3, (f, got_score, score)
+                setattr(core, f, False)
+        finally:
+            for f, v in installed.items():
+                setattr(core, f, v)
+
+
+def test_summary_keeps_session_dates():
+    with tempfile.TemporaryDirectory() as tmp:
+        core = _load_index(Path(tmp))
+        cid, path = _open_smoke_class(core)
+        label = "S001_Ann Lee"
+        sid = core.upsert_student(label, "Ann Lee", "S001")
+        # a check-in row as Excel leaves it after an edit: a real datetime cell
+        core.flush_class_workbooks(evict=True)
+        wb = load_workbook(path)
+        checked_in = datetime(2026, 1, 5, 9, 30)
+        wb["sessions"].append([1, checked_in, sid, label, "Ann Lee", "http://example.com"])
+        wb.save(path)
+
+        core.write_summary_sheet_for_class(cid)
+        core.write_summary_sheet_for_class(cid)
+        row = _sessions_rows(path)[0]
+        assert row[1] == checked_in, row
+        assert row[4:6] == ("Ann Lee", "http://example.com"), row
+        # the rebuilt row index still sees that day's check-in
+        assert core.mark_student_attendance(label, cid, checked_in.replace(hour=15))[3] is False
+
+
+if __name__ == "__main__":
+    for name, check in list(globals().items()):
+        if name.startswith("test_") and callable(check):
+            check()
+            print(f"ok: {name}")
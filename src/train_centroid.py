@@ -4,11 +4,52 @@ import os
 import json
 import numpy as np
 
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
 # project-relative paths
-ROOT       = os.path.normpath(os.path.join(os.path.dirname(__file__), ".."))
-MODELS_DIR = os.path.join(ROOT, "models")
-EMB_FILE   = os.path.join(MODELS_DIR, "embeddings.npz")
-OUT_FILE   = os.path.join(MODELS_DIR, "centroids.json")
+from _paths import MODELS_DIR, EMB_FILE, CENTROIDS_NPY as OUT_FILE, CENTROID_LABELS as OUT_LABELS
+
+
+if HAS_NUMBA:
+    @njit(cache=True, fastmath=True)
+    def _centroid_kernel(X, label_idx, L):
+        # one pass over X accumulating per-label sums, then mean + L2 norm per row
+        N, D = X.shape
+        sums = np.zeros((L, D), np.float32)
+        counts = np.zeros(L, np.int64)
+        for i in range(N):
+            li = label_idx[i]
+            counts[li] += 1
+            for k in range(D):
+                sums[li, k] += X[i, k]
+        for li in range(L):
+            if counts[li] == 0:
+                continue
+            ss = 0.0
+            for k in range(D):
+                sums[li, k] /= counts[li]
+                ss += sums[li, k] * sums[li, k]
+            inv = 1.0 / (np.sqrt(ss) + 1e-12)
+            for k in range(D):
+                sums[li, k] *= inv
+        return sums
+
+
+def label_centroids(X, label_idx, L):
+    """Unit-norm mean of the rows of X for each of the L labels in label_idx."""
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    label_idx = np.ascontiguousarray(label_idx, dtype=np.int64)
+    if HAS_NUMBA:
+        return _centroid_kernel(X, label_idx, L)
+    sums = np.zeros((L, X.shape[1]), np.float32)
+    np.add.at(sums, label_idx, X)
+    sums /= np.maximum(np.bincount(label_idx, minlength=L), 1)[:, None]
+    sums /= np.linalg.norm(sums, axis=1, keepdims=True) + 1e-12
+    return sums
 
 
 def main():
@@ -32,29 +73,23 @@ def main():
         print("No embeddings or labels found in file.")
         return
 
-    labels = np.unique(y)
+    labels, label_idx = np.unique(y, return_inverse=True)
     if labels.size == 0:
         print("No labels found to build centroids.")
         return
 
-    # compute mean embedding per label
-    centroids = {}
-    for lab in labels:
-        mask = (y == lab)
-        class_vectors = X[mask]
-        if class_vectors.size == 0:
-            continue
-        centroids[str(lab)] = class_vectors.mean(axis=0).tolist()
-
-    if not centroids:
-        print("No centroids were computed. Check your embeddings file.")
-        return
+    # mean embedding per label, in one pass over X
+    C = label_centroids(X, label_idx, labels.size)
 
     os.makedirs(MODELS_DIR, exist_ok=True)
-    with open(OUT_FILE, "w") as f:
-        json.dump({"centroids": centroids}, f)
+    # one float16 matrix (row i belongs to labels[i]) plus a small labels file
+    names = [str(lab) for lab in labels]
+    with open(OUT_FILE, "wb") as f:
+        np.save(f, C.astype(np.float16))
+    with open(OUT_LABELS, "w") as f:
+        json.dump(names, f)
 
-    print(f"Saved centroids for {len(centroids)} class(es) to {OUT_FILE}")
+    print(f"Saved centroids for {len(names)} class(es) to {OUT_FILE}")
 
 
 if __name__ == "__main__":
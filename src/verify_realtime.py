@@ -1,5 +1,6 @@
 import os
 import re
+import atexit
 import json
 import time
 import platform
@@ -9,19 +10,24 @@ from pathlib import Path
 import numpy as np
 import cv2
 from insightface.app import FaceAnalysis
+from insightface.utils import face_align
 from openpyxl import Workbook, load_workbook
 
 # paths and basic configuration (project-relative, universal)
-ROOT = os.path.normpath(os.path.join(os.path.dirname(__file__), ".."))
-MODELS_DIR = os.path.join(ROOT, "models")
-REPORTS_DIR = os.path.join(ROOT, "excel_reports")
-MODEL_FILE = os.path.join(MODELS_DIR, "centroids.json")
+from _paths import (
+    REPORTS_DIR,
+    CENTROIDS as MODEL_FILE,  # legacy layout
+    CENTROIDS_NPY as MODEL_NPY,
+    CENTROID_LABELS as MODEL_LABELS,
+)
 
 THRESHOLD = 0.45          # higher -> more strict match
 DET_SIZE = (640, 640)
+MAX_FRAME_SIDE = 640      # frames are shrunk to this before detection
 LOG_COOLDOWN_SEC = 600    # do not mark same face again within 10 minutes
 
 Path(REPORTS_DIR).mkdir(parents=True, exist_ok=True)
+cv2.setUseOptimized(True)
 
 # state for current session
 MODE = "PROFESSOR"  # first recognized face is professor
@@ -33,12 +39,43 @@ CLASS_INFO = {
 }
 STUDENT_META = {}          # face_label -> (student_name, student_code)
 SESSION_ATTENDANCE = []    # list of dicts with attendance entries
+# the class workbook stays open for the whole session: rows are appended in
+# memory and written out at most every SAVE_DEBOUNCE_SEC, and once more at the end
+WORKBOOK = {"wb": None, "dirty": False, "saved_at": 0.0}
+SAVE_DEBOUNCE_SEC = 1.0
+# lookups over the Attendance sheet, kept in step with every appended row
+CHECKED_IN = set()         # (face_label, "YYYY-MM-DD")
+ATTENDANCE_DATES = set()   # distinct "YYYY-MM-DD" values in the sheet
+
+
+def index_attendance(ws):
+    """Rebuild CHECKED_IN / ATTENDANCE_DATES from an Attendance sheet."""
+    CHECKED_IN.clear()
+    ATTENDANCE_DATES.clear()
+    # max_col=7 stops openpyxl at the Date column and pads short rows to length 7
+    for r in ws.iter_rows(min_row=2, max_col=7, values_only=True):
+        if r[6]:
+            ATTENDANCE_DATES.add(str(r[6]))
+        CHECKED_IN.add((r[3], r[6]))
+
+
+def save_workbook(force: bool = False):
+    """Write the open class workbook if it has unsaved rows (debounced unless forced)."""
+    wb = WORKBOOK["wb"]
+    file_path = CLASS_INFO["file_path"]
+    if wb is None or not file_path or not WORKBOOK["dirty"]:
+        return
+    if not force and time.time() - WORKBOOK["saved_at"] < SAVE_DEBOUNCE_SEC:
+        return
+    # save beside the real file and swap it in, so a crash never leaves a torn workbook
+    tmp = file_path + ".tmp"
+    wb.save(tmp)
+    os.replace(tmp, file_path)
+    WORKBOOK["dirty"] = False
+    WORKBOOK["saved_at"] = time.time()
 
 
-def cos_sim(a: np.ndarray, b: np.ndarray) -> float:
-    a = a / np.linalg.norm(a)
-    b = b / np.linalg.norm(b)
-    return float(np.dot(a, b))
+atexit.register(save_workbook, force=True)
 
 
 def open_cam():
@@ -87,8 +124,13 @@ def open_cam():
 
 
 def load_centroids():
+    if os.path.exists(MODEL_NPY) and os.path.exists(MODEL_LABELS):
+        mat = np.load(MODEL_NPY, mmap_mode="r").astype(np.float32)  # stored as float16
+        with open(MODEL_LABELS, "r") as f:
+            labels = json.load(f)
+        return {k: mat[i] for i, k in enumerate(labels)}
     if not os.path.exists(MODEL_FILE):
-        print(f"Centroids file not found: {MODEL_FILE}")
+        print(f"Centroids file not found: {MODEL_NPY}")
         print("Run build_embeddings.py and train_centroid.py first.")
         return {}
     with open(MODEL_FILE, "r") as f:
@@ -96,6 +138,14 @@ def load_centroids():
     return {k: np.array(v, dtype=np.float32) for k, v in raw.items()}
 
 
+def centroid_matrix(centroids):
+    """Stack centroids into (labels, unit-norm contiguous float32 (N, D) matrix)."""
+    labels = list(centroids)
+    C = np.stack([centroids[k] for k in labels]).astype(np.float32)
+    C /= np.linalg.norm(C, axis=1, keepdims=True) + 1e-12
+    return labels, np.ascontiguousarray(C)
+
+
 def create_class_excel(prof_face_label: str):
     """Ask professor details and create an Excel file for this class."""
     print("\nProfessor detected. Please enter class details.")
@@ -125,7 +175,10 @@ def create_class_excel(prof_face_label: str):
             "Time",
         ]
     )
-    wb.save(file_path)
+    # first written by the debounced save in the main loop, usually together
+    # with the first check-ins
+    WORKBOOK.update(wb=wb, dirty=True, saved_at=time.time())
+    index_attendance(ws)
 
     CLASS_INFO["class_name"] = class_name
     CLASS_INFO["prof_name"] = prof_name
@@ -145,8 +198,9 @@ def append_attendance_to_excel(face_label: str, student_name: str, student_code:
     if not file_path:
         return
 
-    wb = load_workbook(file_path)
+    wb = WORKBOOK["wb"]
     ws = wb["Attendance"]
+    day = dt.strftime("%Y-%m-%d")
 
     ws.append(
         [
@@ -156,11 +210,14 @@ def append_attendance_to_excel(face_label: str, student_name: str, student_code:
             face_label,
             student_code,
             student_name,
-            dt.strftime("%Y-%m-%d"),
+            day,
             dt.strftime("%H:%M:%S"),
         ]
     )
-    wb.save(file_path)
+    CHECKED_IN.add((face_label, day))
+    ATTENDANCE_DATES.add(day)
+    WORKBOOK["dirty"] = True
+    save_workbook()
 
 
 def mark_student_attendance(face_label: str, frame) -> None:
@@ -176,22 +233,7 @@ def mark_student_attendance(face_label: str, frame) -> None:
     dt = datetime.now()
 
     # Prevent duplicate check-ins on the same calendar date
-    file_path = CLASS_INFO.get("file_path")
-    already_today = False
-    if file_path and os.path.exists(file_path):
-        wb = load_workbook(file_path, data_only=True)
-        if "Attendance" in wb.sheetnames:
-            ws = wb["Attendance"]
-            for r in ws.iter_rows(min_row=2, values_only=True):
-                try:
-                    row_face = r[3]
-                    row_date = r[6]
-                except Exception:
-                    row_face = None
-                    row_date = None
-                if row_face == face_label and row_date == dt.strftime("%Y-%m-%d"):
-                    already_today = True
-                    break
+    already_today = (face_label, dt.strftime("%Y-%m-%d")) in CHECKED_IN
 
     if already_today:
         cv2.putText(
@@ -257,17 +299,12 @@ def show_class_summary():
             summary_map[code] = {"name": name, "count": 0}
         summary_map[code]["count"] += 1
 
-    # compute total classes by counting unique dates in the Attendance sheet
-    wb = load_workbook(CLASS_INFO["file_path"], data_only=True)
-    ws_att = wb["Attendance"]
-    dates = set()
-    for r in ws_att.iter_rows(min_row=2, values_only=True):
-        try:
-            d = r[6]
-        except Exception:
-            d = None
-        if d:
-            dates.add(str(d))
+    # total classes = unique dates in the Attendance sheet
+    wb = WORKBOOK["wb"]
+    if wb is None:
+        wb = WORKBOOK["wb"] = load_workbook(CLASS_INFO["file_path"])
+        index_attendance(wb["Attendance"])
+    dates = ATTENDANCE_DATES
     total_classes = max(1, len(dates))
 
     total_present = len(summary_map)
@@ -332,7 +369,8 @@ def show_class_summary():
         adjusted_width = min(max_length + 2, 50)  # add 2 for padding, max 50
         ws.column_dimensions[col_letter].width = adjusted_width
 
-    wb.save(CLASS_INFO["file_path"])
+    WORKBOOK["dirty"] = True
+    save_workbook(force=True)
     print(f"\nSummary written to: {CLASS_INFO['file_path']}")
 
 
@@ -346,9 +384,12 @@ def main():
     centroids = load_centroids()
     if not centroids:
         return
+    # every frame is scored against all centroids with one matrix-vector product
+    labels, C = centroid_matrix(centroids)
 
     app = FaceAnalysis(name="buffalo_l")
     app.prepare(ctx_id=0, det_size=DET_SIZE)
+    rec = app.models["recognition"]
 
     cap = open_cam()
     if cap is None:
@@ -375,9 +416,18 @@ def main():
                 break
             continue
 
-        faces = app.get(frame)
+        # detect on a downscaled copy; the box and landmarks are mapped back, so
+        # the aligned crop for recognition is cut from the full-size frame, at
+        # the same resolution as the enrollment photos
+        h, w = frame.shape[:2]
+        scale = MAX_FRAME_SIDE / max(h, w)
+        if scale < 1.0:
+            small = cv2.resize(frame, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+        else:
+            small, scale = frame, 1.0
+        bboxes, kpss = app.det_model.detect(small, max_num=0, metric="default")
 
-        if not faces:
+        if bboxes is None or len(bboxes) == 0 or kpss is None:
             cv2.putText(
                 frame,
                 "No face detected",
@@ -388,22 +438,20 @@ def main():
                 2,
             )
         else:
-            f = max(
-                faces,
-                key=lambda z: (z.bbox[2] - z.bbox[0]) * (z.bbox[3] - z.bbox[1]),
-            )
-            emb = f.normed_embedding
+            areas = (bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1])
+            j = int(np.argmax(areas))
+            crop = face_align.norm_crop(frame, landmark=kpss[j] / scale, image_size=rec.input_size[0])
+            emb = np.asarray(rec.get_feat([crop]), dtype=np.float32).ravel()
+            emb /= np.linalg.norm(emb)
 
-            best_lab, best_sim = "Unknown", -1.0
-            for lab, c in centroids.items():
-                s = cos_sim(emb, c)
-                if s > best_sim:
-                    best_sim, best_lab = s, lab
+            sims = C @ emb
+            i = int(np.argmax(sims))
+            best_lab, best_sim = labels[i], float(sims[i])
 
             recognized = best_sim >= THRESHOLD
             name_to_draw = best_lab if recognized else "Not Registered"
 
-            x1, y1, x2, y2 = map(int, f.bbox)
+            x1, y1, x2, y2 = (int(v / scale) for v in bboxes[j][:4])
             color = (0, 200, 0) if recognized else (0, 0, 255)
             cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
             cv2.putText(
@@ -439,6 +487,7 @@ def main():
                         mark_student_attendance(face_label, frame)
                         last_logged[face_label] = now
 
+        save_workbook()  # flush rows held back by the debounce
         cv2.imshow("Verification", frame)
         if cv2.waitKey(1) & 0xFF == ord("q"):
             break
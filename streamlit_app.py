@@ -2,39 +2,44 @@ import streamlit as st
 import os
 from io import BytesIO
 import csv
+import shutil
+import tempfile
 from pathlib import Path
 
+import cv2
+import numpy as np
+
 from src import index as core
 
 st.set_page_config(page_title="Face Attendance", layout="wide")
 
 
+@st.cache_resource
+def get_face_app():
+    # built once per server process and shared by every session and rerun
+    return core.face_app()
+
+
 def get_embedding_from_bgr(img):
-    """Return a normalized embedding for a BGR image using insightface if available,
-    otherwise fall back to the coarse image feature."""
+    """Return a unit-norm embedding for a BGR image using insightface if available,
+    otherwise fall back to the coarse image feature (also unit-norm)."""
     try:
-        import numpy as np
         if core.HAS_INSIGHTFACE:
             try:
-                app = core.face_app()
+                app = get_face_app()
                 faces = app.get(img)
             except Exception:
                 faces = []
             if not faces:
                 return None
             f = max(faces, key=lambda z: (z.bbox[2]-z.bbox[0])*(z.bbox[3]-z.bbox[1]))
-            return f.normed_embedding.astype(core.np.float32)
+            return f.normed_embedding.astype(np.float32)
         else:
             return core.compute_image_feature(img)
     except Exception:
         return None
 
 
-def cosine(a, b):
-    a = a / (core.np.linalg.norm(a) + 1e-12)
-    b = b / (core.np.linalg.norm(b) + 1e-12)
-    return float(core.np.dot(a, b))
-
 def save_uploaded_images(uploaded_files, folder: str):
     Path(folder).mkdir(parents=True, exist_ok=True)
     written = 0
@@ -46,38 +51,126 @@ def save_uploaded_images(uploaded_files, folder: str):
         written += 1
     return written
 
-def update_class_csv(class_id: int):
-    # ensure Summary sheet exists and then write it to CSV (overwrite)
-    core.write_summary_sheet_for_class(class_id)
-    xlpath = core._class_filepath_for_id(class_id)
-    if not xlpath or not os.path.exists(xlpath):
+@st.cache_resource
+def _embedding_cache() -> dict:
+    # folder -> {file name: ((mtime_ns, size), embedding or None)}, shared across reruns
+    return {}
+
+def folder_embeddings(folder: str):
+    """core.folder_embeddings, embedding only photos added or rewritten since the last call."""
+    with os.scandir(folder) as it:
+        stamps = {}
+        for e in it:
+            if e.is_file():
+                info = e.stat()
+                stamps[e.name] = (info.st_mtime_ns, info.st_size)
+    old = _embedding_cache().get(folder, {})
+    # unchanged photos keep their embedding; removed ones drop out with the old dict
+    entries = {n: old[n] for n, stamp in stamps.items() if n in old and old[n][0] == stamp}
+    todo = sorted(n for n in stamps if n not in entries)
+    if todo:
+        imgs = core.read_images([os.path.join(folder, n) for n in todo])
+        for n, emb in zip(todo, core.image_embeddings(imgs)):
+            entries[n] = (stamps[n], emb)
+    _embedding_cache()[folder] = entries
+    feats = [emb for _, (_, emb) in sorted(entries.items()) if emb is not None]
+    return np.stack(feats) if feats else None
+
+def stage_capture(camera) -> str:
+    """Write a camera capture to this session's staging folder and return its path.
+
+    Only the path is kept in session state, not the JPEG bytes.
+    """
+    stage = st.session_state.get("stage_dir")
+    if not stage or not os.path.isdir(stage):
+        stage = st.session_state["stage_dir"] = tempfile.mkdtemp(prefix="face_caps_")
+    fd, path = tempfile.mkstemp(suffix=".jpg", dir=stage)
+    with os.fdopen(fd, "wb") as f:
+        f.write(camera.getbuffer())
+    return path
+
+def move_captures(paths, folder: str) -> list:
+    """Move staged captures into `folder` under the usual capture file names.
+
+    Returns their new paths, for restore_captures.
+    """
+    Path(folder).mkdir(parents=True, exist_ok=True)
+    moved = []
+    for i, p in enumerate(paths):
+        dst = os.path.join(folder, f"{int(core.time.time() * 1000)}_cap_{i}.jpg")
+        shutil.move(p, dst)
+        moved.append(dst)
+    _release_stage()
+    return moved
+
+def restore_captures(moved, paths):
+    """Undo move_captures: put the files at `moved` back at their staged `paths`."""
+    for src, dst in zip(moved, paths):
+        # the staging folder may have been released by the move
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        shutil.move(src, dst)
+    if paths:
+        st.session_state["stage_dir"] = os.path.dirname(paths[0])
+    if moved:
+        try:
+            os.rmdir(os.path.dirname(moved[0]))  # drop the folder if that left it empty
+        except OSError:
+            pass
+
+def discard_captures(paths):
+    for p in paths:
+        try:
+            os.remove(p)
+        except OSError:
+            pass
+    _release_stage()
+
+def _release_stage():
+    # the professor and student queues share the staging folder, so it is
+    # removed only once neither has a capture left in it
+    stage = st.session_state.get("stage_dir")
+    if stage and not (os.path.isdir(stage) and os.listdir(stage)):
+        shutil.rmtree(stage, ignore_errors=True)
+        st.session_state.pop("stage_dir", None)
+
+def update_class_csv(class_id: int, write_xlsx: bool = True):
+    """Write the class summary to a CSV beside its workbook and return the path.
+
+    The rows come from core's cached workbook, so the .xlsx is not re-read;
+    `write_xlsx=False` also skips refreshing its Summary sheet (check-ins).
+    """
+    if write_xlsx:
+        core.write_summary_sheet_for_class(class_id)
+    rows = core.summary_rows_for_class(class_id)
+    if rows is None:
         return None
+    xlpath = core._class_filepath_for_id(class_id)
     csv_path = os.path.splitext(xlpath)[0] + ".csv"
-    try:
-        wb = core.load_workbook(xlpath, data_only=True)
-    except Exception:
-        return None
-    if "Summary" not in wb.sheetnames:
-        return None
-    ws = wb["Summary"]
-    rows = []
-    for r in ws.iter_rows(values_only=True):
-        rows.append(["" if v is None else v for v in r])
     # write CSV (overwrite existing file)
     with open(csv_path, "w", newline="", encoding="utf-8") as cf:
-        w = csv.writer(cf)
-        for row in rows:
-            w.writerow(row)
+        csv.writer(cf).writerows(rows)
     return csv_path
 
-def list_classes():
+@st.cache_data(max_entries=4)
+def _class_list(meta_stamp):
+    # meta_stamp only keys the cache: a write to the classes file changes it
     meta = core.load_classes_meta()
     classes = meta.get("classes", {})
     items = []
     for cid, info in classes.items():
         items.append((int(cid), info.get("class_name"), info.get("professor_name"), info.get("professor_code")))
     items.sort()
-    return items
+    # dropdown labels built once alongside, for both menu branches
+    labels = [f"{c[0]}: {c[1]} (Prof: {c[2]})" for c in items]
+    return items, labels
+
+def list_classes():
+    """Return (classes, dropdown labels), cached until the classes file changes."""
+    try:
+        stamp = core._file_stamp(core.CLASSES_META)
+    except OSError:
+        stamp = None
+    return _class_list(stamp)
 
 def main():
     st.title("Face Attendance — Streamlit")
@@ -98,9 +191,10 @@ def main():
                 if prof_camera is None:
                     st.error("Take a photo first using the camera widget.")
                 else:
-                    st.session_state["prof_caps"].append(prof_camera.getbuffer())
+                    st.session_state["prof_caps"].append(stage_capture(prof_camera))
             st.write(f"Captured: {len(st.session_state['prof_caps'])}/{target_photos}")
             if st.button("Reset captures"):
+                discard_captures(st.session_state["prof_caps"])
                 st.session_state["prof_caps"] = []
             if len(st.session_state["prof_caps"]) >= target_photos:
                 if st.button("Save professor captures to disk"):
@@ -109,12 +203,8 @@ def main():
                     else:
                         label = f"prof_{prof_code}_{prof_name}"
                         folder = os.path.join(core.DATA_DIR, label)
-                        Path(folder).mkdir(parents=True, exist_ok=True)
-                        # write captures
-                        for i, b in enumerate(st.session_state["prof_caps"]):
-                            out_path = os.path.join(folder, f"{int(core.time.time() * 1000)}_cap_{i}.jpg")
-                            with open(out_path, "wb") as f:
-                                f.write(b)
+                        # captures are already on disk; move them into place
+                        move_captures(st.session_state["prof_caps"], folder)
                         st.success(f"Saved {len(st.session_state['prof_caps'])} photos for professor")
                         st.session_state["prof_caps"] = []
 
@@ -129,51 +219,33 @@ def main():
                     if not os.path.isdir(folder):
                         st.error("No professor images saved. Upload or capture images first.")
                     else:
-                        # run per-image embedding checks
-                        embs = []
-                        valid = 0
-                        from pathlib import Path as _P
-                        import cv2, numpy as _np
-                        for p in _P(folder).glob("*"):
-                            img = cv2.imread(str(p))
-                            if img is None:
-                                continue
-                            e = get_embedding_from_bgr(img)
-                            if e is not None:
-                                embs.append(e)
-                                valid += 1
+                        # run per-image embedding checks (one batched recognition pass)
+                        embs = folder_embeddings(folder)
+                        valid = 0 if embs is None else len(embs)
                         if valid < max(12, int(target_photos * 0.75)):
                             st.error(f"Not enough valid face detections ({valid}). Capture clearer photos.")
                         else:
                             # pairwise similarity checks
-                            sims = []
-                            for i in range(len(embs)):
-                                for j in range(i+1, len(embs)):
-                                    sims.append(cosine(embs[i], embs[j]))
-                            mean_sim = float(_np.mean(sims)) if sims else 0.0
-                            std_sim = float(_np.std(sims)) if sims else 0.0
+                            mean_sim, std_sim = core.pairwise_cos_stats(embs)
                             if mean_sim > 0.995:
                                 st.error("Captured images appear identical — possible duplicate/cheat. Vary expressions/angles.")
                             elif mean_sim < 0.5:
                                 st.error("Captured images look very inconsistent. Ensure images are of the same person.")
                             else:
+                                # same embeddings as the checks above, no second pass over the folder
                                 cents = core.load_centroids()
-                                centroid = core.compute_centroid_for_folder(folder)
-                                if centroid is None:
-                                    st.error("Could not compute face embedding for professor images.")
-                                else:
-                                    cents[label] = centroid
-                                    core.save_centroids(cents)
-                                    cid = core.create_class(label, prof_name, prof_code, class_name)
-                                    st.success(f"Class created: {class_name} (id {cid})")
+                                cents[label] = core.unit_mean(embs)
+                                core.save_centroids(cents)
+                                cid = core.create_class(label, prof_name, prof_code, class_name)
+                                st.success(f"Class created: {class_name} (id {cid})")
 
         st.markdown("---")
         st.header("Register Student to Class")
-        classes = list_classes()
+        classes, class_labels = list_classes()
         if not classes:
             st.info("No classes created yet.")
         else:
-            sel = st.selectbox("Choose class", [f"{c[0]}: {c[1]} (Prof: {c[2]})" for c in classes])
+            sel = st.selectbox("Choose class", class_labels)
             sel_id = int(str(sel).split(":", 1)[0])
             student_name = st.text_input("Student name", key="sname")
             student_code = st.text_input("Student id/code", key="scode")
@@ -185,9 +257,10 @@ def main():
                 if student_camera is None:
                     st.error("Capture a photo first using the camera widget")
                 else:
-                    st.session_state["stu_caps"].append(student_camera.getbuffer())
+                    st.session_state["stu_caps"].append(stage_capture(student_camera))
             st.write(f"Captured: {len(st.session_state['stu_caps'])}/{target_photos_stu}")
             if st.button("Reset student captures"):
+                discard_captures(st.session_state["stu_caps"])
                 st.session_state["stu_caps"] = []
             if len(st.session_state["stu_caps"]) >= target_photos_stu:
                 if st.button("Register student to class"):
@@ -196,68 +269,49 @@ def main():
                     else:
                         label = f"{student_code}_{student_name}"
                         folder = os.path.join(core.DATA_DIR, label)
-                        Path(folder).mkdir(parents=True, exist_ok=True)
-                        for i, b in enumerate(st.session_state["stu_caps"]):
-                            out_path = os.path.join(folder, f"{int(core.time.time() * 1000)}_cap_{i}.jpg")
-                            with open(out_path, "wb") as f:
-                                f.write(b)
-                        # run embedding checks
-                        embs = []
-                        import cv2, numpy as _np
-                        from pathlib import Path as _P
-                        for p in _P(folder).glob("*"):
-                            img = cv2.imread(str(p))
-                            if img is None:
-                                continue
-                            e = get_embedding_from_bgr(img)
-                            if e is not None:
-                                embs.append(e)
-                        if len(embs) < max(12, int(target_photos_stu * 0.75)):
-                            st.error(f"Not enough valid face detections ({len(embs)}). Capture clearer photos.")
+                        staged = st.session_state["stu_caps"]
+                        moved = move_captures(staged, folder)
+                        # run embedding checks (one batched recognition pass)
+                        embs = folder_embeddings(folder)
+                        valid = 0 if embs is None else len(embs)
+                        error = None
+                        if valid < max(12, int(target_photos_stu * 0.75)):
+                            error = f"Not enough valid face detections ({valid}). Capture clearer photos."
                         else:
-                            sims = []
-                            for i in range(len(embs)):
-                                for j in range(i+1, len(embs)):
-                                    sims.append(cosine(embs[i], embs[j]))
-                            mean_sim = float(_np.mean(sims)) if sims else 0.0
+                            mean_sim, _ = core.pairwise_cos_stats(embs)
                             if mean_sim > 0.995:
-                                st.error("Captured images appear identical — possible duplicate/cheat. Vary expressions/angles.")
+                                error = "Captured images appear identical — possible duplicate/cheat. Vary expressions/angles."
                             elif mean_sim < 0.5:
-                                st.error("Captured images look inconsistent. Ensure images are of the same person.")
+                                error = "Captured images look inconsistent. Ensure images are of the same person."
+                        if error:
+                            # rejected photos go back to the queue, to retry or reset
+                            restore_captures(moved, staged)
+                            st.error(error)
+                        else:
+                            # the staged files now live in the folder, so the queue is spent
+                            st.session_state["stu_caps"] = []
+                            # same embeddings as the checks above, no second pass over the folder
+                            cents = core.load_centroids()
+                            cents[label] = core.unit_mean(embs)
+                            core.save_centroids(cents)
+                            core.upsert_student(label, student_name, student_code)
+                            # link to class workbook
+                            filepath = core._class_filepath_for_id(sel_id)
+                            if not filepath or not os.path.exists(filepath):
+                                st.error("Class workbook not found")
                             else:
-                                cents = core.load_centroids()
-                                centroid = core.compute_centroid_for_folder(folder)
-                                if centroid is None:
-                                    st.error("Could not compute embedding for student images")
-                                else:
-                                    cents[label] = centroid
-                                    core.save_centroids(cents)
-                                    core.upsert_student(label, student_name, student_code)
-                                    # link to class workbook
-                                    filepath = core._class_filepath_for_id(sel_id)
-                                    if not filepath or not os.path.exists(filepath):
-                                        st.error("Class workbook not found")
-                                    else:
-                                        wb = core.load_workbook(filepath)
-                                        ws_students = wb["students"]
-                                        exists = False
-                                        for r in ws_students.iter_rows(min_row=2, values_only=True):
-                                            if r[1] == label or r[0] == core.get_student_id_by_face_label(label):
-                                                exists = True
-                                                break
-                                        if not exists:
-                                            ws_students.append([core.get_student_id_by_face_label(label), label, student_name, student_code, 0])
-                                            wb.save(filepath)
-                                        st.success(f"Student {student_name} registered to class {sel_id}")
-                                    st.session_state["stu_caps"] = []
+                                # cached workbook + row index: no load/scan/save of the file here
+                                core.add_student_to_class(sel_id, filepath, core.get_student_id_by_face_label(label),
+                                                          label, student_name, student_code)
+                                st.success(f"Student {student_name} registered to class {sel_id}")
 
     else:
         st.header("Open Class and Check-In")
-        classes = list_classes()
+        classes, class_labels = list_classes()
         if not classes:
             st.info("No classes available. Create one first.")
             return
-        sel = st.selectbox("Select class to open/check", [f"{c[0]}: {c[1]} (Prof: {c[2]})" for c in classes])
+        sel = st.selectbox("Select class to open/check", class_labels)
         sel_id = int(str(sel).split(":", 1)[0])
         prof_login = st.text_input("Professor id (to open class)")
         if st.button("Open class (login)"):
@@ -275,10 +329,8 @@ def main():
                 # append session row
                 filepath = cls.get("file")
                 if filepath and os.path.exists(filepath):
-                    wb = core.load_workbook(filepath)
-                    ws_sessions = wb["sessions"]
-                    ws_sessions.append([session_id, core.datetime.now().isoformat(), "", "", "", ""])
-                    wb.save(filepath)
+                    # core keeps the workbook open; check-ins and the CSV reuse it
+                    core.add_session_row(sel_id, filepath, session_id)
                 st.success(f"Class opened (session {session_id}). Students can now check-in.")
 
         st.markdown("---")
@@ -288,15 +340,15 @@ def main():
         if st.button("Check-In Student"):
             # obtain image bytes from selected mode
             img = None
-            import cv2
-            import numpy as np
             if check_camera is None:
                 st.error("Capture a photo first using the camera widget")
                 img = None
             else:
                 img_bytes = check_camera.getbuffer()
-                arr = np.frombuffer(img_bytes, np.uint8)
-                img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+                # big captures are decoded at half size; fit_frame shrinks them anyway
+                img = core.decode_image(img_bytes, reduced=img_bytes.nbytes > core.REDUCED_DECODE_BYTES)
+                if img is not None:
+                    img = core.fit_frame(img)
 
             if img is None:
                 pass
@@ -309,27 +361,12 @@ def main():
                         st.error("No trained centroids available")
                     else:
                         # compute embedding
-                        if core.HAS_INSIGHTFACE:
-                            try:
-                                appface = core.face_app()
-                                faces = appface.get(img)
-                            except Exception:
-                                faces = []
-                            if not faces:
-                                st.info("No face detected")
-                            else:
-                                f = max(faces, key=lambda z: (z.bbox[2]-z.bbox[0])*(z.bbox[3]-z.bbox[1]))
-                                emb = f.normed_embedding.astype(core.np.float32)
-                        else:
-                            emb = core.compute_image_feature(img)
+                        emb = get_embedding_from_bgr(img)
                         if emb is None:
-                            st.error("Could not compute embedding")
+                            st.error("No face detected / could not compute embedding")
                         else:
-                            best_lab, best_sim = "Unknown", -1.0
-                            for lab, c in cents.items():
-                                s = core.norm_cos(emb, c)
-                                if s > best_sim:
-                                    best_sim, best_lab = s, lab
+                            # one product against the cached centroid matrix
+                            best_lab, best_sim = core.match_centroid(emb)
                             if best_sim < core.THRESHOLD:
                                 st.info(f"Not registered (sim={best_sim:.2f})")
                             elif best_lab.startswith("prof_"):
@@ -346,8 +383,9 @@ def main():
                                         st.info(f"{student_name} ({student_code}) already marked today for {class_name}")
                                 else:
                                     st.info(res)
-                                # update csv for class
-                                csvp = update_class_csv(sel_id)
+                                # update csv for class; the workbook's Summary sheet is
+                                # refreshed by "Prepare CSV" or the dashboard instead
+                                csvp = update_class_csv(sel_id, write_xlsx=False)
                                 if csvp:
                                     with open(csvp, "rb") as f:
                                         st.download_button("Download updated CSV", f, file_name=os.path.basename(csvp), mime="text/csv")